@@ -0,0 +1,357 @@
+"""Bulk ADR explanations for a backlog of saved encounters.
+
+Reads encounters (the dict the EHR app saves) from a JSONL or CSV file,
+builds the same prompt as the interactive ADR assistant, and streams them
+through an asyncio pipeline:
+
+- at most ``--concurrency`` requests in flight,
+- a token bucket capping requests per second (``--rate`` / ``--burst``),
+- exponential backoff with jitter on rate limits, timeouts and 5xx errors,
+- one JSONL line appended per finished encounter, so an interrupted run
+  resumes where it stopped and only retries encounters that failed.
+
+    python adr_batch.py encounters.jsonl -o adr_results.jsonl --concurrency 16 --rate 10
+
+Point ``OPENAI_BASE_URL`` at ``mock_completion_server.py`` to try it
+without an API key.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from adr_utils import (
+    ADR_MODEL,
+    ADR_TEMPERATURE,
+    ADR_TIMEOUT,
+    adr_messages,
+    build_adr_prompt,
+    cache_key,
+    compute_adr_risk_level,
+    get_api_key,
+    response_cache,
+)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+# HTTP statuses worth retrying; anything else (bad request, auth) fails fast
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, up to ``burst`` saved."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = max(burst or rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _number(value):
+    """CSV cell as int/float, or None when blank or not numeric."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return None
+
+
+def _record_id(record: dict, id_field: str, position: int) -> str:
+    value = record.get(id_field)
+    # An ID of 0 is an ID; only a missing or blank one falls back
+    if value is None or value == "":
+        return f"row-{position}"
+    return str(value)
+
+
+def iter_encounters(path: str, id_field: str = "id"):
+    """Yield ``(encounter_id, record)`` from a JSONL or CSV file.
+
+    Records without ``id_field`` are keyed by their position in the file,
+    which stays stable across resumed runs of the same input.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for position, record in enumerate(csv.DictReader(f)):
+                yield _record_id(record, id_field, position), record
+        return
+
+    with open(path, encoding="utf-8") as f:
+        position = 0
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield _record_id(record, id_field, position), record
+            position += 1
+
+
+def encounter_prompt(record: dict):
+    """``(prompt, risk_level)`` for one saved encounter."""
+    meds = record.get("meds") or ""
+    age = _number(record.get("age"))
+    spo2 = _number(record.get("spo2"))
+
+    risk_level = record.get("adr_risk_level")
+    if not risk_level:
+        num_meds = _number(record.get("num_meds"))
+        if num_meds is None:
+            num_meds = len([m for m in str(meds).split("\n") if m.strip()])
+        risk_level, _ = compute_adr_risk_level(
+            age=age,
+            num_meds=num_meds,
+            condition=record.get("patient_condition"),
+            bp_str=record.get("bp"),
+            spo2=spo2,
+        )
+
+    vitals = {
+        "bp": record.get("bp"),
+        "hr": record.get("hr"),
+        "rr": record.get("rr"),
+        "temp": record.get("temp_c", record.get("temp")),
+        "spo2": record.get("spo2"),
+    }
+    prompt = build_adr_prompt(
+        age,
+        record.get("sex"),
+        meds,
+        record.get("allergies") or "",
+        record.get("pmh") or "",
+        record.get("admission_dx") or "",
+        vitals,
+        risk_level,
+    )
+    return prompt, risk_level
+
+
+def load_checkpoint(path: str) -> set:
+    """IDs already answered in ``path``; failed encounters are retried.
+
+    A line cut off by an interrupted run is dropped from the file so new
+    results append cleanly.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if result.get("status") == STATUS_OK:
+            done.add(result["id"])
+        else:
+            done.discard(result.get("id"))
+    return done
+
+
+def _retry_after(exc) -> float:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def _is_retryable(exc) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in RETRY_STATUSES
+
+
+async def complete_with_retries(
+    client,
+    messages: list,
+    bucket: TokenBucket = None,
+    max_retries: int = 5,
+    backoff: float = 1.0,
+    max_backoff: float = 60.0,
+    model: str = ADR_MODEL,
+    temperature: float = ADR_TEMPERATURE,
+):
+    """``(text, attempts)`` for one chat completion, retrying transient errors.
+
+    Waits ``uniform(0, min(max_backoff, backoff * 2**attempt))`` between
+    attempts (at least as long as a Retry-After header asks), and takes a
+    rate-limit token before every attempt.
+    """
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+            return response.choices[0].message.content.strip(), attempt + 1
+        except Exception as exc:
+            if attempt == max_retries or not _is_retryable(exc):
+                exc.attempts = attempt + 1
+                raise
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+            await asyncio.sleep(max(delay, _retry_after(exc)))
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    client=None,
+    concurrency: int = 8,
+    rate: float = None,
+    burst: float = None,
+    max_retries: int = 5,
+    backoff: float = 1.0,
+    id_field: str = "id",
+    model: str = ADR_MODEL,
+    progress_every: int = 100,
+) -> dict:
+    """Generate ADR explanations for every encounter in ``input_path``.
+
+    Results are appended to ``output_path`` as JSONL; encounters already
+    answered there are skipped. Returns counts of the run.
+    """
+    if client is None:
+        from openai import AsyncOpenAI
+
+        # Retries are handled here, with the shared rate limit in the loop
+        client = AsyncOpenAI(
+            api_key=get_api_key(),
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+            timeout=ADR_TIMEOUT,
+            max_retries=0,
+        )
+
+    done = load_checkpoint(output_path)
+    bucket = TokenBucket(rate, burst) if rate else None
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"ok": 0, "error": 0, "skipped": 0, "cached": 0, "retries": 0}
+    started = time.monotonic()
+
+    out = open(output_path, "a", encoding="utf-8")
+
+    def record(result: dict):
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        stats[result["status"]] += 1
+        finished = stats["ok"] + stats["error"]
+        if progress_every and finished % progress_every == 0:
+            rate_now = finished / max(time.monotonic() - started, 1e-9)
+            print(f"{finished:,} done ({stats['error']:,} failed, {rate_now:.1f}/s)", file=sys.stderr)
+
+    async def produce():
+        for encounter_id, encounter in iter_encounters(input_path, id_field):
+            if encounter_id in done:
+                stats["skipped"] += 1
+                continue
+            await queue.put((encounter_id, encounter))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            encounter_id, encounter = item
+            result = {"id": encounter_id}
+            t0 = time.monotonic()
+            try:
+                prompt, risk_level = encounter_prompt(encounter)
+                messages = adr_messages(prompt)
+                key = cache_key(messages, model)
+                result["adr_risk_level"] = risk_level
+
+                text = response_cache.get(key)
+                attempts = 0
+                if text is None:
+                    text, attempts = await complete_with_retries(
+                        client, messages, bucket, max_retries, backoff, model=model
+                    )
+                    response_cache.set(key, text)
+                else:
+                    stats["cached"] += 1
+                result.update(status=STATUS_OK, text=text, attempts=attempts)
+            except Exception as exc:
+                attempts = getattr(exc, "attempts", 1)
+                result.update(status=STATUS_ERROR, error=repr(exc), attempts=attempts)
+            stats["retries"] += max(attempts - 1, 0)
+            result["seconds"] = round(time.monotonic() - t0, 3)
+            record(result)
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+    finally:
+        out.flush()
+        os.fsync(out.fileno())
+        out.close()
+
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate ADR explanations for a file of encounters")
+    parser.add_argument("input", help="Encounters as JSONL or CSV")
+    parser.add_argument("-o", "--output", default="adr_results.jsonl", help="JSONL results; reused to resume")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--rate", type=float, help="Requests per second (default: unlimited)")
+    parser.add_argument("--burst", type=float, help="Requests allowed at once after an idle spell (default: rate)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base seconds for exponential backoff")
+    parser.add_argument("--id-field", default="id", help="Encounter ID field (default: position in file)")
+    parser.add_argument("--model", default=ADR_MODEL)
+    args = parser.parse_args(argv)
+
+    if not get_api_key():
+        print("OPENAI_API_KEY is not set.", file=sys.stderr)
+        return 2
+
+    stats = asyncio.run(run_batch(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        max_retries=args.max_retries,
+        backoff=args.backoff,
+        id_field=args.id_field,
+        model=args.model,
+    ))
+    print(json.dumps(stats), file=sys.stderr)
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import stage_timer, timed, record_rows, record_cache
+
+ADR_MODEL = "gpt-4o-mini"
+ADR_TEMPERATURE = 0.3
+ADR_SYSTEM_PROMPT = (
+    "You are a cautious clinical decision-support explainer. You never provide medical advice or prescribe."
+)
+
+# Response cache: in-memory LRU with a TTL, optionally backed by a directory
+ADR_CACHE_SIZE = int(os.environ.get("ADR_CACHE_SIZE", "256"))
+ADR_CACHE_TTL = float(os.environ.get("ADR_CACHE_TTL", "3600"))
+ADR_CACHE_DIR = os.environ.get("ADR_CACHE_DIR")
+
+# Background ADR analyses: worker threads per process and the longest a
+# request may take before the UI gives up on it
+ADR_WORKERS = int(os.environ.get("ADR_WORKERS", "4"))
+ADR_TIMEOUT = float(os.environ.get("ADR_TIMEOUT", "60"))
+
+NOT_CONFIGURED_MESSAGE = (
+    "ADR Assistant is not configured.\n\n"
+    "Please set OPENAI_API_KEY in environment variables or Streamlit secrets."
+)
+
+
+def compute_adr_risk_level(age, num_meds, condition, bp_str, spo2):
+    """
+    Simple heuristic ADR risk classifier: returns ("Low"/"Moderate"/"High", score_int)
+    """
+    score = 0
+
+    # Age
+    if age is not None and age >= 65:
+        score += 1
+
+    # Polypharmacy
+    if num_meds is not None and num_meds >= 5:
+        score += 1
+
+    # Condition
+    if condition in ["Guarded", "Critical"]:
+        score += 1
+
+    # Blood pressure (try to parse systolic/diastolic)
+    try:
+        if bp_str and "/" in bp_str:
+            parts = bp_str.replace(" ", "").split("/")
+            systolic = int(parts[0])
+            diastolic = int(parts[1])
+            if systolic < 100 or diastolic < 60:
+                score += 1
+    except Exception:
+        pass
+
+    # SpO2
+    try:
+        if spo2 is not None and spo2 < 92:
+            score += 1
+    except Exception:
+        pass
+
+    if score <= 0:
+        return "Low", score
+    elif score <= 2:
+        return "Moderate", score
+    else:
+        return "High", score
+
+
+ADR_RISK_CONDITIONS = ["Guarded", "Critical"]
+ADR_RISK_LEVELS = ["Low", "Moderate", "High"]
+
+# An ASCII BP component int() accepts once spaces are removed: optional
+# surrounding whitespace (the ASCII characters int() strips), a sign, and digits with
+# single underscores between them. Spelled out rather than \s / \d because
+# the regex runs in pyarrow (RE2), not Python's re.
+_BP_SPACE = "[\t\n\x0b\x0c\r]"
+_BP_NUMBER = "[+-]?[0-9]+(?:_[0-9]+)*"
+_BP_PATTERN = (
+    f"^{_BP_SPACE}*(?P<sys>{_BP_NUMBER}){_BP_SPACE}*/"
+    f"{_BP_SPACE}*(?P<dia>{_BP_NUMBER}){_BP_SPACE}*(?:/[\\s\\S]*)?$"
+)
+
+
+def _numeric_rule(values, threshold, compare):
+    """Vectorized ``value is not None and compare(value, threshold)``.
+
+    Numeric columns are compared directly (NaN never scores). Object
+    columns may mix types, so they fall back to the scalar comparison,
+    with values the scalar rule could not compare counted as no score.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return compare(values.astype(float).to_numpy(), threshold)
+
+    def one(v):
+        try:
+            return v is not None and bool(compare(v, threshold))
+        except Exception:
+            return False
+    return np.fromiter((one(v) for v in values), dtype=bool, count=len(values))
+
+
+def _bp_flags(bp):
+    """Vectorized BP rule: systolic < 100 or diastolic < 60."""
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if pd.api.types.is_string_dtype(bp) and bp.dtype != object:
+        is_str = bp.notna().to_numpy(dtype=bool)
+    else:
+        is_str = bp.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    flags = np.zeros(len(bp), dtype=bool)
+    if not is_str.any():
+        # Empty, or no strings at all (e.g. an all-NaN column read from CSV)
+        return flags
+
+    text = pa.array(bp[is_str], type=pa.string())
+    ascii_ = pc.string_is_ascii(text).to_numpy(zero_copy_only=False)
+    text = pc.replace_substring(text.filter(ascii_), " ", "")
+
+    # First two "/"-separated parts, each a valid int() literal; anything
+    # after a second "/" is ignored, as in the scalar rule
+    parts = pc.extract_regex(text, _BP_PATTERN)
+    if isinstance(parts, pa.ChunkedArray):
+        parts = parts.combine_chunks()
+    valid = parts.is_valid()
+    systolic, diastolic = (
+        pc.cast(
+            pc.replace_substring(pc.replace_substring(parts.field(name).filter(valid), "_", ""), "+", ""),
+            pa.float64(),
+        )
+        for name in ("sys", "dia")
+    )
+    low = pc.or_(pc.less(systolic, 100), pc.less(diastolic, 60)).to_numpy(zero_copy_only=False)
+
+    str_rows = np.flatnonzero(is_str)
+    flags[str_rows[ascii_][valid.to_numpy(zero_copy_only=False)]] = low
+    # Non-ASCII input (e.g. full-width digits) is rare; the scalar rule reads
+    # it exactly as int() does
+    for row, value in zip(str_rows[~ascii_], bp.iloc[str_rows[~ascii_]]):
+        flags[row] = compute_adr_risk_level(None, None, None, value, None)[1] > 0
+    return flags
+
+
+@timed("adr_batch_score")
+def score_adr_risk_batch(
+    data,
+    age="age",
+    num_meds="num_meds",
+    condition="patient_condition",
+    bp="bp",
+    spo2="spo2",
+):
+    """Score many encounters at once with the ``compute_adr_risk_level`` rules.
+
+    ``data`` is a pandas DataFrame or pyarrow Table; the keyword
+    arguments name its columns. Returns a DataFrame aligned with the input
+    with ``adr_risk_level`` (categorical) and ``adr_risk_score`` columns,
+    identical to calling the scalar function row by row.
+    """
+    import operator
+    import numpy as np
+    import pandas as pd
+
+    if not isinstance(data, pd.DataFrame):
+        data = data.to_pandas()
+    record_rows("adr_batch_score", len(data))
+
+    score = (
+        _numeric_rule(data[age], 65, operator.ge).astype(np.int64)
+        + _numeric_rule(data[num_meds], 5, operator.ge)
+        + data[condition].isin(ADR_RISK_CONDITIONS).to_numpy()
+        + _bp_flags(data[bp])
+        + _numeric_rule(data[spo2], 92, operator.lt)
+    )
+    level = pd.Categorical.from_codes(
+        np.select([score <= 0, score <= 2], [0, 1], default=2), ADR_RISK_LEVELS
+    )
+    return pd.DataFrame({"adr_risk_level": level, "adr_risk_score": score}, index=data.index)
+
+
+def get_api_key():
+    """OpenAI key from the environment or Streamlit secrets, or None."""
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        try:
+            import streamlit as st
+            api_key = st.secrets["OPENAI_API_KEY"]
+        except Exception:
+            api_key = None
+    return api_key
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key: str, base_url: str = None):
+    """Process-wide OpenAI client per (key, base URL).
+
+    Reusing the client keeps its HTTP connection pool warm across reruns.
+    A request fails after at most ``ADR_TIMEOUT`` seconds; it is not retried.
+    ``base_url`` (default: OPENAI_BASE_URL) lets tests point at a local
+    stand-in server.
+    """
+    base_url = base_url or os.environ.get("OPENAI_BASE_URL")
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI
+            # No SDK retries: each one would restart the timeout, keeping a
+            # worker busy for up to three times ADR_TIMEOUT after the UI
+            # has given up on the request
+            client = OpenAI(api_key=api_key, base_url=base_url, timeout=ADR_TIMEOUT, max_retries=0)
+            _clients[key] = client
+    return client
+
+
+class ResponseCache:
+    """Thread-safe LRU of completion texts with a TTL and optional disk store."""
+
+    def __init__(self, max_entries: int = ADR_CACHE_SIZE, ttl: float = ADR_CACHE_TTL, disk_dir: str = ADR_CACHE_DIR):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()  # key -> (created, text)
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if now - entry["created"] <= self.ttl:
+                self._remember(key, entry["created"], entry["text"])
+                return entry["text"]
+        return None
+
+    def set(self, key: str, text: str):
+        created = time.time()
+        self._remember(key, created, text)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "text": text}, f)
+            os.replace(tmp, path)
+
+    def _remember(self, key: str, created: float, text: str):
+        with self._lock:
+            self._entries[key] = (created, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+# Completions currently being fetched, so identical concurrent requests wait
+# for the first one instead of making their own call
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _normalize_text(value) -> str:
+    """Collapse whitespace per line and drop blank lines."""
+    lines = (" ".join(line.split()) for line in str(value).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def build_adr_prompt(age, sex, meds, allergies, pmh, diagnosis, vitals, risk_level) -> str:
+    """User prompt for the ADR explanation, built from normalized inputs."""
+    meds, allergies, pmh, diagnosis = (
+        _normalize_text(v) for v in (meds, allergies, pmh, diagnosis)
+    )
+
+    vitals_text = (
+        f"BP: {vitals.get('bp')} mmHg, "
+        f"HR: {vitals.get('hr')} bpm, "
+        f"RR: {vitals.get('rr')} breaths/min, "
+        f"Temp: {vitals.get('temp')} °C, "
+        f"SpO2: {vitals.get('spo2')}%."
+    )
+
+    return f"""
+You are an AI assistant that helps clinicians reflect on potential adverse drug reactions (ADR).
+You are NOT a doctor and must NOT give medical advice, diagnoses, or treatment.
+You only highlight general risk patterns and monitoring suggestions in a conservative way.
+
+Patient summary:
+- Age: {age}
+- Sex: {sex}
+- Vitals: {vitals_text}
+- Current medications (free text): {meds}
+- Allergies: {allergies}
+- Past medical history: {pmh}
+- Working diagnosis / ICD-10: {diagnosis}
+- Simple heuristic ADR risk level (from rules): {risk_level}
+
+Tasks:
+1. Briefly describe overall ADR risk level (Low / Moderate / High) with reasoning.
+2. Mention possible risk factors (polypharmacy, age, organ impairment, hypotension, hypoxia, drug–allergy or drug–condition conflicts).
+3. Mention only general monitoring suggestions (e.g., watch for GI upset, bleeding, CNS changes), not specific treatments.
+4. Explicitly add a strong disclaimer at the end that this is NOT medical advice and must not replace clinical judgment.
+
+Respond in under 250 words, use simple Markdown and short bullet points.
+"""
+
+
+def adr_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": ADR_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def cache_key(messages: list, model: str = ADR_MODEL, temperature: float = ADR_TEMPERATURE) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_completion(client, messages: list, model: str = ADR_MODEL, temperature: float = ADR_TEMPERATURE) -> str:
+    """Chat completion text, served from the cache when the inputs repeat.
+
+    Concurrent calls with the same inputs share one API request. Errors
+    are raised to every waiter and never cached.
+    """
+    key = cache_key(messages, model, temperature)
+    text = response_cache.get(key)
+    record_cache("adr_response", text is not None)
+    if text is not None:
+        return text
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+    if not owner:
+        return future.result()
+
+    try:
+        with stage_timer("adr_completion"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+        text = response.choices[0].message.content.strip()
+        response_cache.set(key, text)
+        future.set_result(text)
+        return text
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def run_adr_assistant(
+    age,
+    sex,
+    meds,
+    allergies,
+    pmh,
+    diagnosis,
+    vitals,
+    risk_level
+):
+    """
+    Calls OpenAI to generate an ADR risk explanation.
+    Requires OPENAI_API_KEY configured in env or Streamlit secrets.
+    Repeated summaries are answered from the response cache.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return NOT_CONFIGURED_MESSAGE
+
+    prompt = build_adr_prompt(age, sex, meds, allergies, pmh, diagnosis, vitals, risk_level)
+    return cached_completion(get_openai_client(api_key), adr_messages(prompt))
+
+
+_executor = ThreadPoolExecutor(max_workers=ADR_WORKERS, thread_name_prefix="adr")
+
+
+def submit_adr_analysis(**kwargs) -> Future:
+    """Run ``run_adr_assistant`` on a background thread and return its future.
+
+    Keep the future in the user's session and poll it, so the page keeps
+    responding while the completion is in flight.
+    """
+    return _executor.submit(run_adr_assistant, **kwargs)
@@ -0,0 +1,306 @@
+"""Benchmarks for the ICD-10 and ADR hot paths.
+
+Each scale of the synthetic code set (1x, 10x, 100x the CMS file) is
+measured in its own process, so load times are really cold and peak RSS
+belongs to that scale alone:
+
+- cold load (first ``load_icd10()`` from the Parquet cache), warm load
+  (again, with the file in the page cache) and index build;
+- ``search_icd10()`` latency (p50/p99) over a mix of codes, prefixes,
+  words and typos, ranked (EHR app) and unranked (ICD-10 explorer);
+- ``icd10_option_labels()`` on the ranked results (EHR selectbox);
+- peak RSS.
+
+The ADR rules (``compute_adr_risk_level`` row by row and
+``score_adr_risk_batch``) are measured once, separately.
+
+    python benchmarks/run.py                        # 1x, 10x, 100x
+    python benchmarks/run.py --scales 1 10 --queries 500
+    python benchmarks/run.py --compare benchmarks/results/a.json benchmarks/results/b.json
+
+Results are written to ``benchmarks/results/<date>-<commit>.json``.
+Synthetic tables are generated once per scale and seed and kept in
+``benchmarks/.data``.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DATA_DIR = os.path.join(HERE, ".data")
+RESULTS_DIR = os.path.join(HERE, "results")
+
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_QUERIES = 1000
+ADR_ENCOUNTERS = 100_000
+
+# A metric this much slower than the baseline is flagged by --compare
+REGRESSION_RATIO = 1.2
+
+
+def _scale_name(scale: float) -> str:
+    return f"{scale:g}x"
+
+
+def _source_path(scale: float, seed: int) -> str:
+    """Stand-in "workbook" for a synthetic table.
+
+    ``icd10_utils`` keys its Parquet cache on the workbook's hash, so the
+    synthetic table is written as the cache of this small file and loaded
+    through the same code path as the real one.
+    """
+    return os.path.join(DATA_DIR, f"icd10-synthetic-{_scale_name(scale)}-seed{seed}.txt")
+
+
+def _worker_env(scale: float, seed: int) -> dict:
+    env = dict(os.environ)
+    env["ICD10_PATH"] = _source_path(scale, seed)
+    env["ICD10_CACHE_DIR"] = os.path.join(DATA_DIR, "cache")
+    for name in ("ICD10_SERVICE_URL", "ICD10_SHARED_TABLE"):
+        env.pop(name, None)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, HERE, env.get("PYTHONPATH")]))
+    return env
+
+
+def _percentiles(seconds: list) -> dict:
+    import numpy as np
+
+    ms = np.asarray(seconds) * 1000
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+    }
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def prepare(scale: float, seed: int):
+    """Generate the synthetic table for a scale unless it already exists."""
+    import icd10_utils
+    import synthetic
+
+    source = _source_path(scale, seed)
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    if not os.path.exists(source):
+        with open(source, "w") as f:
+            f.write(f"synthetic ICD-10 table: scale={scale:g} seed={seed}\n")
+    target = icd10_utils.cache_path_for(source)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        synthetic.icd10_table(scale, seed).to_parquet(f"{target}.tmp", index=False)
+        os.replace(f"{target}.tmp", target)
+
+
+def measure_icd10(scale: float, seed: int, n_queries: int) -> dict:
+    """Run in a fresh process per scale (see ``_worker_env``)."""
+    import icd10_utils
+    import synthetic
+
+    result = {"scale": scale}
+
+    t0 = time.perf_counter()
+    df = icd10_utils.load_icd10()
+    result["cold_load_s"] = round(time.perf_counter() - t0, 4)
+    result["rows"] = len(df)
+
+    warm = []
+    for _ in range(3):
+        icd10_utils.load_icd10.cache_clear()
+        t0 = time.perf_counter()
+        icd10_utils.load_icd10()
+        warm.append(time.perf_counter() - t0)
+    result["warm_load_s"] = round(sorted(warm)[1], 4)
+
+    t0 = time.perf_counter()
+    icd10_utils.get_icd10_index()
+    result["index_build_s"] = round(time.perf_counter() - t0, 4)
+
+    queries = synthetic.query_mix(icd10_utils.load_icd10(), n_queries, seed)
+    for _, query in queries[:20]:
+        icd10_utils.search_icd10(query, ranked=True)
+
+    timings = {"ranked": {}, "unranked": {}, "option_labels": {}}
+    for kind, query in queries:
+        t0 = time.perf_counter()
+        top = icd10_utils.search_icd10(query, ranked=True, k=50)
+        t1 = time.perf_counter()
+        if not top.empty:
+            icd10_utils.icd10_option_labels(top)
+            timings["option_labels"].setdefault(kind, []).append(time.perf_counter() - t1)
+        timings["ranked"].setdefault(kind, []).append(t1 - t0)
+
+        t0 = time.perf_counter()
+        icd10_utils.search_icd10(query)
+        timings["unranked"].setdefault(kind, []).append(time.perf_counter() - t0)
+
+    for mode, by_kind in timings.items():
+        result[mode] = {kind: _percentiles(values) for kind, values in sorted(by_kind.items())}
+        result[mode]["all"] = _percentiles([v for values in by_kind.values() for v in values])
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def measure_adr(seed: int, n: int = ADR_ENCOUNTERS) -> dict:
+    from adr_utils import compute_adr_risk_level, score_adr_risk_batch
+    import synthetic
+
+    data = synthetic.encounters(n, seed)
+    rows = list(data.itertuples(index=False))
+
+    t0 = time.perf_counter()
+    for r in rows:
+        compute_adr_risk_level(r.age, r.num_meds, r.patient_condition, r.bp, r.spo2)
+    scalar = time.perf_counter() - t0
+
+    score_adr_risk_batch(data.head(1000))
+    t0 = time.perf_counter()
+    score_adr_risk_batch(data)
+    batch = time.perf_counter() - t0
+
+    return {
+        "encounters": n,
+        "scalar_us_per_row": round(scalar / n * 1e6, 4),
+        "batch_us_per_row": round(batch / n * 1e6, 4),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_worker(args: list, env: dict) -> dict:
+    """Run this script in worker mode and return its JSON result."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode != 0:
+        reason = f"exit code {proc.returncode}"
+        if proc.returncode in (-9, 137):
+            reason += " (killed, likely out of memory)"
+        return {"error": reason, "stderr": proc.stderr[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(scales, n_queries: int, seed: int) -> dict:
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "queries": n_queries,
+        "icd10": {},
+    }
+    for scale in scales:
+        name = _scale_name(scale)
+        env = _worker_env(scale, seed)
+        print(f"[{name}] preparing synthetic table", file=sys.stderr)
+        prepared = _run_worker(["--prepare", str(scale), "--seed", str(seed)], env)
+        if "error" in prepared:
+            report["icd10"][name] = prepared
+            continue
+        print(f"[{name}] measuring", file=sys.stderr)
+        report["icd10"][name] = _run_worker(
+            ["--worker", str(scale), "--seed", str(seed), "--queries", str(n_queries)], env
+        )
+    print("[adr] measuring", file=sys.stderr)
+    report["adr"] = _run_worker(["--adr", "--seed", str(seed)], _worker_env(1, seed))
+    return report
+
+
+def _flatten(report: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline_path: str, current_path: str) -> int:
+    """Print metric changes between two result files; 1 if any regressed."""
+    def metrics(path):
+        with open(path) as f:
+            report = json.load(f)
+        return _flatten({"icd10": report.get("icd10", {}), "adr": report.get("adr", {})})
+
+    baseline, current = metrics(baseline_path), metrics(current_path)
+    timed = ("_s", "_ms", "_us_per_row", "_mb")
+    regressed = False
+    for name in sorted(set(baseline) & set(current)):
+        if not name.endswith(timed) or not baseline[name]:
+            continue
+        ratio = current[name] / baseline[name]
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+        regressed |= bool(flag)
+        print(f"{name:60s} {baseline[name]:>12g} -> {current[name]:>12g}  x{ratio:.2f}{flag}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ICD-10 and ADR hot paths")
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES,
+                        help="Table sizes relative to the CMS file (default: 1 10 100)")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries per scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Result file (default: benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files")
+    parser.add_argument("--prepare", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--adr", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare)
+    if args.prepare is not None:
+        prepare(args.prepare, args.seed)
+        print(json.dumps({"prepared": args.prepare}))
+        return 0
+    if args.worker is not None:
+        print(json.dumps(measure_icd10(args.worker, args.seed, args.queries)))
+        return 0
+    if args.adr:
+        print(json.dumps(measure_adr(args.seed)))
+        return 0
+
+    report = run(args.scales, args.queries, args.seed)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
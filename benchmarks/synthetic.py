@@ -0,0 +1,158 @@
+"""Synthetic ICD-10 tables, query mixes and encounters for the benchmarks.
+
+Tables have the CMS file's columns and roughly its shape: 3-7 character
+codes grouped under 3-character categories, short and long descriptions
+of Zipf-distributed words, and a few percent of rows flagged NF excluded.
+Everything is generated from a seed, so a given scale and seed always
+produce the same data.
+"""
+import numpy as np
+import pandas as pd
+
+# Rows in the CMS Section 111 file (Jan 2026), i.e. scale 1x
+CMS_ROWS = 73_916
+
+CODE_COLUMN = "CODE"
+SHORT_COLUMN = "SHORT DESCRIPTION (VALID ICD-10 FY2025)"
+LONG_COLUMN = "LONG DESCRIPTION (VALID ICD-10 FY2025)"
+NF_COLUMN = "NF EXCL"
+
+# Common words of the real descriptions, so the head of the vocabulary
+# looks like ICD-10 text; the long tail is made-up words
+COMMON_WORDS = (
+    "encounter with other in of subsequent initial sequela unspecified involving "
+    "right left and fracture injury for routine healing displaced nondisplaced "
+    "due to without complications open closed bone leg arm hand foot disease "
+    "acute chronic type diabetes mellitus hypertension pneumonia infection "
+    "neoplasm malignant benign poisoning accidental intentional self harm "
+    "contact burn degree region lower upper part site specified abdominal pain "
+    "heart failure kidney stage lung organism syndrome disorder delayed nonunion"
+).split()
+
+SYLLABLES = (
+    "ab ac ad al am an ar as at ba be bi bo ca ce ci co cu da de di do "
+    "el em en er es et fa fe fi fo ga ge gi go ha he hi ho ic id il im in "
+    "is it la le li lo lu ma me mi mo mu na ne ni no nu ob oc od ol om on "
+    "or os ot pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu "
+    "ul um un ur us va ve vi vo xy ze"
+).split()
+
+CODE_LETTERS = np.array(list("ABCDEFGHIJKLMNOPQRSTVWXYZ"))
+CODE_CHARS = np.array(list("0123456789ABCDEFGHJKLMNPQRSTVWXYZ"))
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """``size`` distinct words: the common words first, then made-up ones."""
+    words = list(dict.fromkeys(COMMON_WORDS))
+    seen = set(words)
+    while len(words) < size:
+        n = rng.integers(2, 5)
+        word = "".join(rng.choice(SYLLABLES, n))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words[:size], dtype=object)
+
+
+def synthetic_codes(rows: int, rng: np.random.Generator) -> np.ndarray:
+    """``rows`` distinct codes in sorted order, 3-7 characters long."""
+    codes = set()
+    while len(codes) < rows:
+        n = int((rows - len(codes)) * 1.2) + 16
+        category = rng.integers(0, len(CODE_LETTERS) * 100, n)
+        letters = CODE_LETTERS[category // 100]
+        digits = np.char.zfill((category % 100).astype(str), 2)
+        # Roughly the CMS length mix: mostly 7-character codes
+        lengths = rng.choice([0, 1, 2, 3, 4], n, p=[0.01, 0.07, 0.09, 0.13, 0.70])
+        suffix = CODE_CHARS[rng.integers(0, len(CODE_CHARS), (n, 4))]
+        codes.update(
+            f"{letter}{digit}{''.join(tail[:k])}"
+            for letter, digit, tail, k in zip(letters, digits, suffix, lengths)
+        )
+    codes = np.array(sorted(codes), dtype=object)
+    if len(codes) > rows:
+        codes = np.sort(rng.choice(codes, rows, replace=False))
+    return codes
+
+
+def _descriptions(counts: np.ndarray, vocab_size: int, rng: np.random.Generator, vocab: np.ndarray) -> list:
+    word_ids = np.minimum(rng.zipf(1.15, counts.sum()) - 1, vocab_size - 1)
+    words = vocab[word_ids]
+    ends = np.cumsum(counts)
+    return [" ".join(words[end - n:end]) for n, end in zip(counts, ends)]
+
+
+def icd10_table(scale: float = 1, seed: int = 0) -> pd.DataFrame:
+    """Synthetic code set with ``scale`` times the CMS file's rows."""
+    rng = np.random.default_rng(seed)
+    rows = max(int(CMS_ROWS * scale), 1)
+    # Vocabulary grows sub-linearly with the corpus (Heaps' law)
+    vocab_size = int(12_000 * max(scale, 1) ** 0.5)
+    vocab = vocabulary(vocab_size, rng)
+
+    codes = synthetic_codes(rows, rng)
+    short_words = rng.integers(2, 12, rows)
+    short = _descriptions(short_words, vocab_size, rng, vocab)
+    extra = _descriptions(rng.integers(1, 8, rows), vocab_size, rng, vocab)
+    long = [f"{s} {e}" if keep else s for s, e, keep in zip(short, extra, rng.random(rows) < 0.6)]
+    nf = np.where(rng.random(rows) < 0.063, "Y", None)
+    return pd.DataFrame({CODE_COLUMN: codes, SHORT_COLUMN: short, LONG_COLUMN: long, NF_COLUMN: nf})
+
+
+def _typo(word: str, rng: np.random.Generator) -> str:
+    i = int(rng.integers(0, len(word)))
+    letter = "abcdefghijklmnopqrstuvwxyz"[int(rng.integers(0, 26))]
+    edit = rng.integers(0, 3)
+    if edit == 0:
+        return word[:i] + letter + word[i + 1:]
+    if edit == 1:
+        return word[:i] + word[i + 1:]
+    return word[:i] + letter + word[i:]
+
+
+def query_mix(df: pd.DataFrame, n: int = 1000, seed: int = 0) -> list:
+    """``(kind, query)`` pairs: full codes, code prefixes, words and typos.
+
+    Words are one or two description words, sometimes with the last one cut
+    short as if still being typed; typos are one edit away from a real word.
+    """
+    rng = np.random.default_rng(seed + 1)
+    kinds = rng.choice(["code", "prefix", "words", "typo"], n, p=[0.2, 0.25, 0.4, 0.15])
+    rows = rng.integers(0, len(df), n)
+    codes = df[CODE_COLUMN].to_numpy()
+    texts = df[LONG_COLUMN].to_numpy()
+
+    queries = []
+    for kind, row in zip(kinds, rows):
+        code = codes[row]
+        words = str(texts[row]).split()
+        if kind == "code":
+            query = f"{code[:3]}.{code[3:]}" if len(code) > 3 and rng.random() < 0.5 else code
+        elif kind == "prefix":
+            query = code[: int(rng.integers(1, min(len(code), 5) + 1))]
+        elif kind == "words":
+            start = int(rng.integers(0, len(words)))
+            query = " ".join(words[start:start + int(rng.integers(1, 3))])
+            if rng.random() < 0.3 and len(query) > 4:
+                query = query[: int(rng.integers(3, len(query)))]
+        else:
+            long_words = [w for w in words if len(w) >= 5] or words
+            query = _typo(long_words[int(rng.integers(0, len(long_words)))], rng)
+        queries.append((str(kind), query))
+    return queries
+
+
+def encounters(n: int = 100_000, seed: int = 0) -> pd.DataFrame:
+    """Inputs of ``compute_adr_risk_level`` for ``n`` synthetic encounters."""
+    rng = np.random.default_rng(seed + 2)
+    systolic = rng.integers(70, 180, n)
+    diastolic = rng.integers(40, 110, n)
+    bp = np.char.add(np.char.add(systolic.astype(str), "/"), diastolic.astype(str)).astype(object)
+    bp[rng.random(n) < 0.1] = ""
+    return pd.DataFrame({
+        "age": rng.integers(0, 100, n),
+        "num_meds": rng.poisson(3, n),
+        "patient_condition": rng.choice(["", "Stable", "Guarded", "Critical"], n, p=[0.2, 0.5, 0.2, 0.1]),
+        "bp": bp,
+        "spo2": rng.integers(80, 101, n),
+    })
@@ -1,8 +1,17 @@
+import time
+import sqlite3
 import streamlit as st
 from datetime import datetime, date
-import os
-from openai import OpenAI
-from icd10_utils import search_icd10
+from adr_utils import compute_adr_risk_level, submit_adr_analysis, ADR_TIMEOUT
+from encounter_store import get_encounter_store, patient_key
+from metrics import metrics_sidebar, observe, stage_timer
+from startup import start_warmup, icd10_ready, wait_for_icd10
+
+rerun_started = time.perf_counter()
+
+# ICD-10 data (and pandas) load on a background thread from the first page
+# run; icd10_utils is imported where it is used
+start_warmup()
 
 # ---------------------------------------------------------
 # PAGE SETTINGS
@@ -72,14 +81,95 @@ st.sidebar.title("Hanvion Health EHR")
 st.sidebar.subheader("Encounter Context")
 patient_id = st.sidebar.text_input("Patient ID")
 mrn = st.sidebar.text_input("MRN")
+
+# ---------------------------------------------------------
+# PRIOR-ENCOUNTER PREFILL
+# ---------------------------------------------------------
+# Fields carried over from the patient's latest saved encounter. Each is
+# also the key of its widget in sections A, C and H (insurance via the
+# sidebar summary fields, which section H copies).
+PREFILL_FIELDS = [
+    "full_name", "dob", "sex", "phone", "address", "height_cm", "weight_kg",
+    "pmh", "meds", "allergies", "family_history", "social_history",
+    "insurance_payer", "insurance_plan", "insurance_member_id", "insurance_group_number",
+    "coverage_start", "coverage_end", "copay_info", "insurance_notes",
+]
+DATE_FIELDS = {"dob", "coverage_start", "coverage_end"}
+SEX_OPTIONS = ["", "Male", "Female", "Other"]
+
+# Widget defaults, set through session state so prefill can overwrite them
+FIELD_DEFAULTS = {
+    "dob": date(1990, 1, 1),
+    "coverage_start": date(2020, 1, 1),
+    "coverage_end": date(2100, 1, 1),
+}
+for key, default in FIELD_DEFAULTS.items():
+    st.session_state.setdefault(key, default)
+
+
+def reset_prefilled_fields():
+    """Clear every carried-over field, so no value leaks between patients."""
+    for field in PREFILL_FIELDS:
+        st.session_state.pop(field, None)
+    for key, default in FIELD_DEFAULTS.items():
+        st.session_state[key] = default
+
+
+def prefill_from_encounter(encounter: dict):
+    """Copy a saved encounter's carried-over fields into the form widgets."""
+    for field in PREFILL_FIELDS:
+        value = encounter.get(field)
+        if value is None:
+            continue
+        try:
+            if field in DATE_FIELDS:
+                value = date.fromisoformat(value)
+            elif field in ("height_cm", "weight_kg"):
+                value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if field == "sex" and value not in SEX_OPTIONS:
+            continue
+        st.session_state[field] = value
+
+
+prior_encounter = None
+current_patient = patient_key(patient_id, mrn)
+if current_patient is not None:
+    prior_encounter = get_encounter_store().latest_for_patient(patient_id, mrn)
+
+# Prefill once per patient, so later edits in the form are kept. The
+# patient is the identity the store looks up, so adding an MRN next to a
+# Patient ID is not a switch.
+if st.session_state.get("prefilled_for") != current_patient:
+    previous_patient = st.session_state.get("prefilled_for")
+    loaded = st.session_state.get("prefilled_encounter")
+    found = prior_encounter["encounter_id"] if prior_encounter is not None else None
+    # Clear the form only when the stored record behind it changes, so one
+    # patient's data never shows under another. Fixing a typo in an ID with
+    # no saved encounters keeps what was typed, and so does entering the
+    # first patient after typing into an empty form.
+    if found != loaded and (loaded is not None or previous_patient is not None):
+        reset_prefilled_fields()
+    st.session_state.prefilled_for = current_patient
+    st.session_state.prefilled_encounter = found
+    if prior_encounter is not None and found != loaded:
+        prefill_from_encounter(prior_encounter)
+
+if prior_encounter is not None:
+    st.sidebar.caption(
+        f"Prefilled from encounter #{prior_encounter['encounter_id']} "
+        f"({prior_encounter.get('encounter_date') or 'undated'})."
+    )
+
 encounter_type = st.sidebar.selectbox("Encounter Type", ["ER", "Inpatient", "Outpatient"])
 encounter_date = st.sidebar.date_input("Encounter Date", datetime.today())
 provider = st.sidebar.text_input("Provider Name")
 
 st.sidebar.subheader("Insurance (Summary)")
-ins_payer = st.sidebar.text_input("Payer (summary)")
-ins_plan = st.sidebar.text_input("Plan Name (summary)")
-ins_member_id = st.sidebar.text_input("Member ID (summary)")
+ins_payer = st.sidebar.text_input("Payer (summary)", key="insurance_payer")
+ins_plan = st.sidebar.text_input("Plan Name (summary)", key="insurance_plan")
+ins_member_id = st.sidebar.text_input("Member ID (summary)", key="insurance_member_id")
 
 # ---------------------------------------------------------
 # BASIC FORM-HELP ASSISTANT (NON-AI)
@@ -109,6 +199,8 @@ def hanvion_ehr_assistant(question: str) -> str:
         "G. ADR Assistant  H. Insurance  I. Billing & Coding"
     )
 
+metrics_sidebar()
+
 st.sidebar.subheader("Form Help")
 ehr_q = st.sidebar.text_input("Ask about where to enter something:")
 if st.sidebar.button("Ask EHR Helper"):
@@ -124,123 +216,181 @@ def get_age_from_dob(dob_value):
         return today.year - dob_value.year - ((today.month, today.day) < (dob_value.month, dob_value.day))
     return None
 
-def compute_adr_risk_level(age, num_meds, condition, bp_str, spo2):
-    """
-    Simple heuristic ADR risk classifier: returns ("Low"/"Moderate"/"High", score_int)
+def show_adr_badge(adr_level):
+    if adr_level == "Low":
+        st.markdown(f"<span class='adr-low'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
+    elif adr_level == "Moderate":
+        st.markdown(f"<span class='adr-moderate'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
+    else:
+        st.markdown(f"<span class='adr-high'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
+
+def adr_job_pending():
+    job = st.session_state.get("adr_job")
+    return job is not None and job["status"] == "running"
+
+def adr_result_panel():
+    job = st.session_state.get("adr_job")
+    if job is None:
+        return
+
+    future = job["future"]
+    if job["status"] == "running":
+        elapsed = time.time() - job["started"]
+        if future.done():
+            try:
+                job["text"] = future.result()
+                job["status"] = "done"
+            except Exception as exc:
+                job["text"] = f"ADR analysis failed: {exc}"
+                job["status"] = "failed"
+        elif elapsed > ADR_TIMEOUT:
+            future.cancel()
+            job["status"] = "timed out"
+        else:
+            st.info(f"Analyzing possible ADR risks... ({elapsed:.0f}s)")
+            if st.button("Cancel ADR Analysis"):
+                # A request already in flight cannot be stopped; this job is
+                # never polled again, so its result is discarded on arrival
+                future.cancel()
+                job["status"] = "cancelled"
+
+        if job["status"] != "running":
+            # A full rerun re-creates this panel without run_every, which
+            # stops the once-a-second polling
+            st.rerun()
+
+    # Show ADR badge + explanation if available
+    show_adr_badge(job["level"])
+
+    if job["status"] in ("timed out", "cancelled"):
+        st.warning(f"ADR analysis {job['status']}. Run it again to retry.")
+    elif job.get("text"):
+        st.markdown("---")
+        st.markdown(job["text"])
+
+@st.fragment
+def adr_panel(age, sex, meds, allergies, pmh, condition, vitals):
+    """Section G. Runs as a fragment, so starting or polling an analysis
+    reruns only this panel.
+
+    The arguments come from the last full run; the admission diagnosis is
+    read at click time because the ICD-10 panel updates it on its own.
     """
-    score = 0
+    med_list = [m.strip() for m in meds.split("\n") if m.strip()]
+    num_meds = len(med_list) if meds.strip() else 0
 
-    # Age
-    if age is not None and age >= 65:
-        score += 1
+    if not meds.strip():
+        st.warning("Enter Medication History in section C before running ADR assistant.")
+    elif st.button("Run ADR Analysis", disabled=adr_job_pending()):
+        adr_level, adr_score = compute_adr_risk_level(
+            age=age,
+            num_meds=num_meds,
+            condition=condition,
+            bp_str=vitals["bp"],
+            spo2=vitals["spo2"],
+        )
+        st.session_state.adr_job = {
+            "future": submit_adr_analysis(
+                age=age,
+                sex=sex,
+                meds=meds,
+                allergies=allergies,
+                pmh=pmh,
+                diagnosis=current_admission_dx(),
+                vitals=vitals,
+                risk_level=adr_level,
+            ),
+            "started": time.time(),
+            "status": "running",
+            "level": adr_level,
+            "score": adr_score,
+        }
+
+    # While a job is running the results poll once a second; only that
+    # inner fragment reruns, so the rest of the chart stays responsive.
+    st.fragment(adr_result_panel, run_every=1.0 if adr_job_pending() else None)()
 
-    # Polypharmacy
-    if num_meds is not None and num_meds >= 5:
-        score += 1
+# ---------------------------------------------------------
+# ICD-10 SEARCH PANEL
+# ---------------------------------------------------------
+def current_admission_dx():
+    """Selected ICD-10 diagnosis, or the manual entry when none is selected."""
+    return st.session_state.get("icd_selected") or st.session_state.get("admission_dx_manual", "")
 
-    # Condition
-    if condition in ["Guarded", "Critical"]:
-        score += 1
+@st.fragment
+def icd_search_panel():
+    """ICD-10 search inside section B. Typing here reruns only this panel.
 
-    # Blood pressure (try to parse systolic/diastolic)
-    try:
-        if bp_str and "/" in bp_str:
-            parts = bp_str.replace(" ", "").split("/")
-            systolic = int(parts[0])
-            diastolic = int(parts[1])
-            if systolic < 100 or diastolic < 60:
-                score += 1
-    except Exception:
-        pass
-
-    # SpO2
-    try:
-        if spo2 is not None and spo2 < 92:
-            score += 1
-    except Exception:
-        pass
-
-    if score <= 0:
-        return "Low", score
-    elif score <= 2:
-        return "Moderate", score
-    else:
-        return "High", score
-
-def run_adr_assistant(
-    age,
-    sex,
-    meds,
-    allergies,
-    pmh,
-    diagnosis,
-    vitals,
-    risk_level
-):
+    The last query's top results and option labels are kept in the
+    session, so full reruns (e.g. typing in vitals) reuse them instead
+    of searching again.
     """
-    Calls OpenAI to generate an ADR risk explanation.
-    Requires OPENAI_API_KEY configured in env or Streamlit secrets.
-    """
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        try:
-            api_key = st.secrets["OPENAI_API_KEY"]
-        except Exception:
-            api_key = None
-
-    if not api_key:
-        return (
-            "ADR Assistant is not configured.\n\n"
-            "Please set OPENAI_API_KEY in environment variables or Streamlit secrets."
-        )
+    st.markdown("**ICD-10 Search** (from CMS Section 111 file)")
+    icd_query = st.text_input("Search ICD-10 (code or diagnosis text)", key="icd_query")
+    query = icd_query.strip()
+    if not query and not icd10_ready():
+        st.caption("Loading ICD-10 codes in the background…")
+
+    panel = None
+    if query:
+        panel = st.session_state.get("icd_panel")
+        if panel is None or panel["query"] != query:
+            if not icd10_ready():
+                with st.spinner("Loading ICD-10 codes…"):
+                    wait_for_icd10()
+            from icd10_utils import ICD10SearchSession, icd10_option_labels
+
+            if "icd10_search" not in st.session_state:
+                st.session_state.icd10_search = ICD10SearchSession()
+            icd_results = st.session_state.icd10_search.search(query, ranked=True, k=50)
+            panel = {
+                "query": query,
+                "top": icd_results.head(10),
+                "labels": icd10_option_labels(icd_results).tolist(),
+            }
+            st.session_state.icd_panel = panel
 
-    client = OpenAI(api_key=api_key)
+        st.caption(f"Top 10 matches for: {icd_query}")
+        with stage_timer("ehr_render_icd_results"):
+            st.dataframe(panel["top"], use_container_width=True)
 
-    vitals_text = (
-        f"BP: {vitals.get('bp')} mmHg, "
-        f"HR: {vitals.get('hr')} bpm, "
-        f"RR: {vitals.get('rr')} breaths/min, "
-        f"Temp: {vitals.get('temp')} °C, "
-        f"SpO2: {vitals.get('spo2')}%."
-    )
+    if panel and panel["labels"]:
+        st.selectbox("Select Diagnosis", panel["labels"], key="icd_selected")
+    else:
+        st.text_input("Admission Diagnosis (manual entry)", key="admission_dx_manual")
 
-    prompt = f"""
-You are an AI assistant that helps clinicians reflect on potential adverse drug reactions (ADR).
-You are NOT a doctor and must NOT give medical advice, diagnoses, or treatment.
-You only highlight general risk patterns and monitoring suggestions in a conservative way.
-
-Patient summary:
-- Age: {age}
-- Sex: {sex}
-- Vitals: {vitals_text}
-- Current medications (free text): {meds}
-- Allergies: {allergies}
-- Past medical history: {pmh}
-- Working diagnosis / ICD-10: {diagnosis}
-- Simple heuristic ADR risk level (from rules): {risk_level}
-
-Tasks:
-1. Briefly describe overall ADR risk level (Low / Moderate / High) with reasoning.
-2. Mention possible risk factors (polypharmacy, age, organ impairment, hypotension, hypoxia, drug–allergy or drug–condition conflicts).
-3. Mention only general monitoring suggestions (e.g., watch for GI upset, bleeding, CNS changes), not specific treatments.
-4. Explicitly add a strong disclaimer at the end that this is NOT medical advice and must not replace clinical judgment.
-
-Respond in under 250 words, use simple Markdown and short bullet points.
-"""
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a cautious clinical decision-support explainer. You never provide medical advice or prescribe."
-            },
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.3,
-    )
+@st.fragment
+def icd_suggestion_panel(notes: str):
+    """ICD-10 codes suggested from the free-text notes (section F).
 
-    return response.choices[0].message.content.strip()
+    Suggestions are kept in the session with the notes they came from, so
+    they are only recomputed when asked for after the notes change.
+    """
+    st.markdown("**Suggested ICD-10 codes** (from chief complaint, HPI and assessment)")
+    if not notes.strip():
+        st.caption("Enter a chief complaint, HPI or assessment to get suggestions.")
+        return
+
+    if st.button("Suggest ICD-10 codes"):
+        with st.spinner("Matching notes against ICD-10 descriptions…"):
+            wait_for_icd10()
+            from icd10_suggest import suggest_icd10
+
+            st.session_state.icd_suggestions = {"notes": notes, "table": suggest_icd10(notes, k=10)}
+
+    suggestions = st.session_state.get("icd_suggestions")
+    if suggestions is None:
+        return
+    if suggestions["notes"] != notes:
+        st.caption("Notes changed since these suggestions; suggest again to refresh.")
+    table = suggestions["table"]
+    if table.empty:
+        st.caption("No ICD-10 descriptions found in the notes.")
+        return
+    st.dataframe(table.drop(columns="SPANS"), use_container_width=True, hide_index=True)
+    if table["NEGATED"].any():
+        st.caption("NEGATED: mentioned only after a negation (e.g. \"denies chest pain\").")
+    st.caption("Copy the codes that apply into section I for billing.")
 
 # ---------------------------------------------------------
 # HEADER
@@ -268,19 +418,19 @@ left, right = st.columns(2)
 with left:
     # A. Demographics
     with st.expander("A. Demographics", expanded=True):
-        full_name = st.text_input("Full Name")
+        full_name = st.text_input("Full Name", key="full_name")
         dob = st.date_input(
             "Date of Birth",
-            value=date(1990, 1, 1),
+            key="dob",
             min_value=date(1930, 1, 1),
             max_value=date.today(),
         )
-        sex = st.selectbox("Sex", ["", "Male", "Female", "Other"])
-        phone = st.text_input("Phone Number")
-        address = st.text_area("Address", height=60)
+        sex = st.selectbox("Sex", SEX_OPTIONS, key="sex")
+        phone = st.text_input("Phone Number", key="phone")
+        address = st.text_area("Address", height=60, key="address")
 
-        height_cm = st.number_input("Height (cm)", min_value=0.0, max_value=250.0, value=0.0)
-        weight_kg = st.number_input("Weight (kg)", min_value=0.0, max_value=300.0, value=0.0)
+        height_cm = st.number_input("Height (cm)", min_value=0.0, max_value=250.0, key="height_cm")
+        weight_kg = st.number_input("Weight (kg)", min_value=0.0, max_value=300.0, key="weight_kg")
         bmi = None
         if height_cm > 0 and weight_kg > 0:
             bmi = round(weight_kg / ((height_cm / 100) ** 2), 1)
@@ -291,32 +441,17 @@ with left:
         chief_complaint = st.text_area("Chief Complaint")
         mode_of_arrival = st.selectbox("Mode of Arrival", ["Self", "Ambulance", "Transfer", "Referral"])
 
-        st.markdown("**ICD-10 Search** (from CMS Section 111 file)")
-        icd_query = st.text_input("Search ICD-10 (code or diagnosis text)")
-        icd_results = search_icd10(icd_query)
-
-        selected_icd = ""
-        if icd_query:
-            st.caption(f"Top 10 matches for: {icd_query}")
-            st.dataframe(icd_results.head(10), use_container_width=True)
-            if not icd_results.empty:
-                code_col = "CODE" if "CODE" in icd_results.columns else icd_results.columns[0]
-                desc_col = icd_results.columns[1]
-                options = icd_results.head(50).apply(
-                    lambda r: f"{r[code_col]} – {r[desc_col]}", axis=1
-                )
-                selected_icd = st.selectbox("Select Diagnosis", options)
-
-        admission_dx = selected_icd or st.text_input("Admission Diagnosis (manual entry)")
+        icd_search_panel()
+        admission_dx = current_admission_dx()
 
     # C. History
     with st.expander("C. History and Screening", expanded=False):
         hpi = st.text_area("History of Present Illness")
-        pmh = st.text_area("Past Medical History")
-        meds = st.text_area("Medication History (name, dose, frequency)")
-        allergies = st.text_area("Allergies (agent + reaction)")
-        family_history = st.text_area("Family History")
-        social_history = st.text_area("Social History (occupation, smoking, alcohol, etc.)")
+        pmh = st.text_area("Past Medical History", key="pmh")
+        meds = st.text_area("Medication History (name, dose, frequency)", key="meds")
+        allergies = st.text_area("Allergies (agent + reaction)", key="allergies")
+        family_history = st.text_area("Family History", key="family_history")
+        social_history = st.text_area("Social History (occupation, smoking, alcohol, etc.)", key="social_history")
 
 # ---------------- RIGHT COLUMN ----------------
 with right:
@@ -339,77 +474,36 @@ with right:
     with st.expander("F. Assessment and Plan", expanded=False):
         assessment = st.text_area("Assessment (working diagnosis, impression)")
         plan = st.text_area("Plan (labs, imaging, treatment, monitoring, consults)")
+        icd_suggestion_panel("\n".join(filter(None, [chief_complaint, hpi, assessment])))
         patient_condition = st.selectbox("Overall Condition", ["", "Stable", "Guarded", "Critical"])
 
     # G. ADR Assistant
-    adr_text = None
-    adr_level = None
-    adr_score = None
     with st.expander("G. ADR Risk Assistant (Experimental)", expanded=False):
         st.markdown(
             "This ADR assistant uses AI plus simple rules to highlight **possible** ADR risks "
             "based on age, vitals, medications, allergies, history, and diagnosis.\n\n"
             "**It is for educational and decision-support purposes only and is NOT medical advice.**"
         )
-        age = get_age_from_dob(dob)
-        med_list = [m.strip() for m in meds.split("\n") if m.strip()]
-        num_meds = len(med_list) if meds.strip() else 0
-
-        adr_can_run = True
-        if not meds.strip():
-            st.warning("Enter Medication History in section C before running ADR assistant.")
-            adr_can_run = False
-
-        if adr_can_run and st.button("Run ADR Analysis"):
-            vitals_dict = {
-                "bp": bp,
-                "hr": hr,
-                "rr": rr,
-                "temp": temp_c,
-                "spo2": spo2,
-            }
-            adr_level, adr_score = compute_adr_risk_level(
-                age=age,
-                num_meds=num_meds,
-                condition=patient_condition,
-                bp_str=bp,
-                spo2=spo2,
-            )
-            with st.spinner("Analyzing possible ADR risks..."):
-                adr_text = run_adr_assistant(
-                    age=age,
-                    sex=sex,
-                    meds=meds,
-                    allergies=allergies,
-                    pmh=pmh,
-                    diagnosis=admission_dx,
-                    vitals=vitals_dict,
-                    risk_level=adr_level,
-                )
-
-        # Show ADR badge + explanation if available
-        if adr_level:
-            if adr_level == "Low":
-                st.markdown(f"<span class='adr-low'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
-            elif adr_level == "Moderate":
-                st.markdown(f"<span class='adr-moderate'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
-            else:
-                st.markdown(f"<span class='adr-high'>ADR Risk: {adr_level}</span>", unsafe_allow_html=True)
-
-        if adr_text:
-            st.markdown("---")
-            st.markdown(adr_text)
+        adr_panel(
+            age=get_age_from_dob(dob),
+            sex=sex,
+            meds=meds,
+            allergies=allergies,
+            pmh=pmh,
+            condition=patient_condition,
+            vitals={"bp": bp, "hr": hr, "rr": rr, "temp": temp_c, "spo2": spo2},
+        )
 
     # H. Insurance Details
     with st.expander("H. Insurance and Coverage", expanded=False):
         ins_payer_full = st.text_input("Payer Name", value=ins_payer)
         ins_plan_full = st.text_input("Plan Name (e.g. Gold PPO)", value=ins_plan)
         ins_member_id_full = st.text_input("Member ID", value=ins_member_id)
-        ins_group_number = st.text_input("Group Number")
-        coverage_start = st.date_input("Coverage Start Date", value=date(2020, 1, 1))
-        coverage_end = st.date_input("Coverage End Date", value=date(2100, 1, 1))
-        copay_info = st.text_input("Copay / Coinsurance (e.g. $30 per visit)")
-        insurance_notes = st.text_area("Insurance Notes (authorization, limitations, etc.)")
+        ins_group_number = st.text_input("Group Number", key="insurance_group_number")
+        coverage_start = st.date_input("Coverage Start Date", key="coverage_start")
+        coverage_end = st.date_input("Coverage End Date", key="coverage_end")
+        copay_info = st.text_input("Copay / Coinsurance (e.g. $30 per visit)", key="copay_info")
+        insurance_notes = st.text_area("Insurance Notes (authorization, limitations, etc.)", key="insurance_notes")
 
     # I. Billing & Coding
     with st.expander("I. Billing and Coding (CPT / HCPCS / ICD-10)", expanded=False):
@@ -421,10 +515,10 @@ with right:
         billing_notes = st.text_area("Billing Notes (e.g., modifiers, prior auth, medical necessity)")
 
 # ---------------------------------------------------------
-# SAVE ENCOUNTER (DEMO)
+# SAVE ENCOUNTER
 # ---------------------------------------------------------
 st.markdown("---")
-if st.button("Save Encounter (demo only)"):
+if st.button("Save Encounter"):
     age_val = get_age_from_dob(dob)
     med_list = [m.strip() for m in meds.split("\n") if m.strip()]
     num_meds = len(med_list) if meds.strip() else 0
@@ -436,6 +530,15 @@ if st.button("Save Encounter (demo only)"):
         spo2=spo2,
     )
 
+    billing_codes = [c.strip() for c in billing_icd_codes.split("\n") if c.strip()]
+    billing_validation = None
+    if billing_codes:
+        from icd10_utils import validate_icd10_codes, CODE_VALID
+
+        wait_for_icd10()
+        # Checked against the CMS release in force on the encounter date
+        billing_validation = validate_icd10_codes(billing_codes, as_of=encounter_date)
+
     encounter = {
         "patient_id": patient_id,
         "mrn": mrn,
@@ -485,6 +588,9 @@ if st.button("Save Encounter (demo only)"):
         "secondary_cpt": secondary_cpt,
         "hcpcs_code": hcpcs_code,
         "billing_icd_codes": billing_icd_codes,
+        "billing_icd_validation": (
+            billing_validation[["CODE", "STATUS"]].to_dict("records") if billing_validation is not None else []
+        ),
         "billing_notes": billing_notes,
     }
 
@@ -500,7 +606,21 @@ if st.button("Save Encounter (demo only)"):
     if warnings:
         st.warning("Insurance validation warnings:\n- " + "\n- ".join(warnings))
 
-    st.success("Encounter captured (demo only, not stored in a database).")
+    if billing_validation is not None:
+        problems = billing_validation[billing_validation["STATUS"] != CODE_VALID]
+        if not problems.empty:
+            st.warning(
+                "Billing ICD-10 validation:\n- "
+                + "\n- ".join(f"{r.INPUT}: {r.STATUS.replace('_', ' ')}" for r in problems.itertuples())
+            )
+        st.dataframe(billing_validation, use_container_width=True)
+
+    try:
+        encounter_id = get_encounter_store().save(encounter)
+    except sqlite3.Error as exc:
+        st.error(f"Encounter could not be saved: {exc}")
+    else:
+        st.success(f"Encounter #{encounter_id} saved.")
     st.json(encounter)
     st.markdown(
     "[Open full Insurance Eligibility app](https://YOUR-ELIGIBILITY-APP-URL)  "
@@ -510,3 +630,4 @@ st.markdown(
     "[Open full RCM Billing Dashboard](https://YOUR-RCM-APP-URL)"
 )
 
+observe("ehr_rerun", time.perf_counter() - rerun_started)
@@ -0,0 +1,125 @@
+"""Aggregate queries over the exported encounter Parquet dataset.
+
+Every query scans the dataset in record batches, reading only the columns
+it needs and only the month partitions and row groups the filter allows,
+and folds each batch into running totals, so memory stays flat however much
+history has been exported.
+"""
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from adr_utils import ADR_RISK_LEVELS
+from encounter_export import EXPORT_DIR, PARTITIONING, UNKNOWN_MONTH
+
+BATCH_SIZE = 65_536
+
+# Adult BMI bands (WHO): upper bounds, and the band names
+BMI_BAND_EDGES = [18.5, 25.0, 30.0]
+BMI_BANDS = ["Underweight (<18.5)", "Normal (18.5–24.9)", "Overweight (25–29.9)", "Obese (≥30)"]
+BMI_UNKNOWN = "Not recorded"
+
+
+def open_encounter_dataset(path: str = EXPORT_DIR):
+    """The exported dataset, or None if nothing has been exported yet."""
+    if not os.path.isdir(path) or not any(name.startswith("month=") for name in os.listdir(path)):
+        return None
+    return ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+
+
+def encounter_filter(start=None, end=None, encounter_types=None):
+    """Dataset filter for encounter dates ``start``..``end`` and encounter types.
+
+    Date bounds are also applied to the ``month`` partition key, so months
+    outside the range are skipped without being opened.
+    """
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("encounter_date") >= pa.scalar(start, pa.date32()))
+    if end is not None:
+        conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("encounter_date") <= pa.scalar(end, pa.date32()))
+    if start is not None or end is not None:
+        conditions.append(ds.field("month") != UNKNOWN_MONTH)
+    if encounter_types:
+        conditions.append(ds.field("encounter_type").isin(list(encounter_types)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _batches(dataset, columns, filter=None):
+    scanner = dataset.scanner(columns=columns, filter=filter, batch_size=BATCH_SIZE)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch
+
+
+def grouped_counts(dataset, keys: list, filter=None) -> Counter:
+    """Row counts per combination of ``keys``, aggregated batch by batch."""
+    counts = Counter()
+    for batch in _batches(dataset, keys, filter):
+        grouped = pa.Table.from_batches([batch]).group_by(keys, use_threads=False).aggregate([([], "count_all")])
+        values = [grouped.column(key).to_pylist() for key in keys]
+        counts.update(dict(zip(zip(*values), grouped.column("count_all").to_pylist())))
+    return counts
+
+
+def adr_risk_by_encounter_type(dataset, filter=None) -> pd.DataFrame:
+    """Encounters per encounter type (rows) and ADR risk level (columns)."""
+    counts = grouped_counts(dataset, ["encounter_type", "adr_risk_level"], filter)
+    if not counts:
+        return pd.DataFrame(columns=ADR_RISK_LEVELS)
+    series = pd.Series(counts)
+    table = series.unstack(fill_value=0)
+    table.index.name, table.columns.name = "encounter_type", "adr_risk_level"
+    levels = ADR_RISK_LEVELS + [c for c in table.columns if c not in ADR_RISK_LEVELS]
+    return table.reindex(columns=levels, fill_value=0).astype(int)
+
+
+def top_admission_codes(dataset, n: int = 10, filter=None) -> pd.DataFrame:
+    """The ``n`` most frequent admission ICD-10 codes with an example label."""
+    coded = ds.field("admission_code").is_valid()
+    filter = coded if filter is None else filter & coded
+    counts = grouped_counts(dataset, ["admission_code"], filter)
+    top = counts.most_common(n)
+    if not top:
+        return pd.DataFrame(columns=["admission_code", "encounters", "admission_dx"])
+
+    # One label per top code, from a second scan limited to those codes
+    labels = {}
+    wanted = [code for (code,), _ in top]
+    for batch in _batches(dataset, ["admission_code", "admission_dx"], filter & ds.field("admission_code").isin(wanted)):
+        for code, label in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+            labels.setdefault(code, label)
+        if len(labels) == len(wanted):
+            break
+    return pd.DataFrame(
+        [(code, count, labels.get(code)) for (code,), count in top],
+        columns=["admission_code", "encounters", "admission_dx"],
+    )
+
+
+def bmi_band_counts(dataset, filter=None) -> pd.Series:
+    """Encounters per BMI band, including those without a recorded BMI."""
+    totals = np.zeros(len(BMI_BANDS) + 1, dtype=np.int64)
+    for batch in _batches(dataset, ["bmi"], filter):
+        bmi = batch.column(0)
+        recorded = pc.fill_null(pc.greater(bmi, 0), False).to_numpy(zero_copy_only=False)
+        values = bmi.to_numpy(zero_copy_only=False)[recorded]
+        totals[:-1] += np.bincount(np.digitize(values, BMI_BAND_EDGES), minlength=len(BMI_BANDS))
+        totals[-1] += len(recorded) - recorded.sum()
+    return pd.Series(totals, index=BMI_BANDS + [BMI_UNKNOWN], name="encounters")
+
+
+def encounter_types(dataset) -> list:
+    """Encounter types present in the dataset."""
+    return sorted(key for (key,) in grouped_counts(dataset, ["encounter_type"]) if key is not None)
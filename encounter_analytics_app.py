@@ -0,0 +1,67 @@
+import streamlit as st
+from datetime import date
+
+from encounter_store import DB_PATH
+from encounter_export import EXPORT_DIR, export_encounters
+from encounter_analytics import (
+    open_encounter_dataset,
+    encounter_filter,
+    encounter_types,
+    adr_risk_by_encounter_type,
+    top_admission_codes,
+    bmi_band_counts,
+)
+
+st.set_page_config(
+    page_title="Encounter Analytics – Hanvion Health",
+    layout="wide",
+)
+
+st.title("Encounter Analytics")
+st.markdown("#### Hanvion Health – saved encounters (exported to Parquet)")
+
+with st.sidebar:
+    st.header("Data")
+    if st.button("Export new encounters"):
+        try:
+            result = export_encounters(DB_PATH, EXPORT_DIR)
+            st.success(f"Exported {result['exported']:,} new encounters.")
+        except Exception as exc:
+            st.error(f"Export failed: {exc}")
+
+dataset = open_encounter_dataset(EXPORT_DIR)
+if dataset is None:
+    st.info(
+        "No exported encounters yet. Save encounters in the EHR app, then use "
+        "**Export new encounters** (or run `python encounter_export.py`)."
+    )
+    st.stop()
+
+with st.sidebar:
+    st.header("Filters")
+    start = st.date_input("From", value=date(date.today().year, 1, 1))
+    end = st.date_input("To", value=date.today())
+    types = st.multiselect("Encounter Type", encounter_types(dataset))
+    top_n = st.slider("Top admission codes", 5, 50, 10, step=5)
+
+filter_expr = encounter_filter(start, end, types)
+
+st.subheader("ADR risk by encounter type")
+risk = adr_risk_by_encounter_type(dataset, filter_expr)
+if risk.empty:
+    st.caption("No encounters match the filters.")
+else:
+    left, right = st.columns([2, 3])
+    left.dataframe(risk, use_container_width=True)
+    right.bar_chart(risk)
+
+st.subheader("Top admission diagnoses")
+st.dataframe(top_admission_codes(dataset, top_n, filter_expr), use_container_width=True, hide_index=True)
+
+st.subheader("BMI bands")
+bands = bmi_band_counts(dataset, filter_expr)
+left, right = st.columns([2, 3])
+left.dataframe(bands, use_container_width=True)
+right.bar_chart(bands)
+
+st.caption("For educational and demo purposes only.")
@@ -0,0 +1,201 @@
+"""Export saved encounters to Parquet for analytics.
+
+Streams encounters out of the SQLite store in fixed-size chunks, flattens
+the fields analytics needs into typed columns, and writes them as a Parquet
+dataset partitioned by encounter month (``month=2026-01/``). Only rows
+saved since the last export are read; the high-water mark lives in
+``_export_state.json`` next to the data.
+
+    python encounter_export.py                      # data/encounter_parquet
+    python encounter_export.py --out /srv/encounters --chunk-size 20000
+
+Encounters are exported in cells of ``chunk_size`` consecutive IDs, and
+each cell's files are named after the cell and always rewritten whole. A
+rerun after an interrupted export therefore replaces files instead of
+duplicating rows, and repeated small exports keep topping up the last cell
+rather than leaving many small files. The cell size is fixed by the first
+export; to change it, delete the dataset directory and export again.
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from encounter_store import DB_PATH, BUSY_TIMEOUT_MS
+from icd10_utils import CODE_QUERY_RE, format_icd10_code
+
+# Parquet dataset inside the repo (EHR_EXPORT_DIR points elsewhere)
+EXPORT_DIR = os.environ.get("EHR_EXPORT_DIR") or os.path.join(
+    os.path.dirname(__file__), "data", "encounter_parquet"
+)
+STATE_FILE = "_export_state.json"
+CHUNK_SIZE = 50_000
+UNKNOWN_MONTH = "unknown"
+
+ENCOUNTER_SCHEMA = pa.schema([
+    ("encounter_id", pa.int64()),
+    ("saved_at", pa.timestamp("s")),
+    ("patient_id", pa.string()),
+    ("mrn", pa.string()),
+    ("encounter_date", pa.date32()),
+    ("encounter_type", pa.string()),
+    ("provider", pa.string()),
+    ("age", pa.int32()),
+    ("sex", pa.string()),
+    ("height_cm", pa.float64()),
+    ("weight_kg", pa.float64()),
+    ("bmi", pa.float64()),
+    ("hr", pa.float64()),
+    ("rr", pa.float64()),
+    ("temp_c", pa.float64()),
+    ("spo2", pa.float64()),
+    ("pain_score", pa.int32()),
+    ("patient_condition", pa.string()),
+    ("admission_dx", pa.string()),
+    ("admission_code", pa.string()),
+    ("adr_risk_level", pa.string()),
+    ("adr_risk_score", pa.int32()),
+    ("insurance_payer", pa.string()),
+    ("primary_cpt", pa.string()),
+    ("month", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value, cast=float):
+    try:
+        return None if value in (None, "") else cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def admission_code(admission_dx):
+    """ICD-10 code at the start of an admission diagnosis, dotted, or None.
+
+    Handles both the "E11.9 – Type 2 diabetes..." labels from the search
+    box and manual entries that start with a code.
+    """
+    text = _text(admission_dx)
+    if text is None:
+        return None
+    first = text.split()[0].upper()
+    return format_icd10_code(first) if CODE_QUERY_RE.match(first) else None
+
+
+def encounter_columns(rows) -> pa.Table:
+    """Typed table from ``(id, saved_at, data)`` store rows."""
+    columns = {field.name: [] for field in ENCOUNTER_SCHEMA}
+    for encounter_id, saved_at, data in rows:
+        e = json.loads(data)
+        encounter_date = _date(e.get("encounter_date"))
+        values = {
+            "encounter_id": encounter_id,
+            "saved_at": int(saved_at),
+            "encounter_date": encounter_date,
+            "age": _number(e.get("age"), int),
+            "pain_score": _number(e.get("pain_score"), int),
+            "adr_risk_score": _number(e.get("adr_risk_score"), int),
+            "admission_code": admission_code(e.get("admission_dx")),
+            "month": encounter_date.strftime("%Y-%m") if encounter_date else UNKNOWN_MONTH,
+        }
+        for name in ("height_cm", "weight_kg", "bmi", "hr", "rr", "temp_c", "spo2"):
+            values[name] = _number(e.get(name))
+        for name, column in columns.items():
+            column.append(values[name] if name in values else _text(e.get(name)))
+    return pa.table(columns, schema=ENCOUNTER_SCHEMA)
+
+
+def _read_state(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last_id": 0}
+
+
+def _write_state(out_dir: str, state: dict):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_encounters(db_path: str = DB_PATH, out_dir: str = EXPORT_DIR, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Export encounters saved since the last export to the Parquet dataset.
+
+    Holds at most one cell of encounters in memory. Returns the number of
+    new rows exported and the new high-water mark.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    state = _read_state(out_dir)
+    chunk_size = state.setdefault("chunk_size", chunk_size)
+    exported = 0
+
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        while True:
+            next_row = conn.execute(
+                "SELECT MIN(id) FROM encounters WHERE id > ?", (state["last_id"],)
+            ).fetchone()[0]
+            if next_row is None:
+                break
+            # The whole cell holding the next new row, including rows an
+            # earlier export already wrote, so its files are replaced as a unit
+            cell = (next_row - 1) // chunk_size
+            rows = conn.execute(
+                "SELECT id, saved_at, data FROM encounters WHERE id > ? AND id <= ? ORDER BY id",
+                (cell * chunk_size, (cell + 1) * chunk_size),
+            ).fetchall()
+            ds.write_dataset(
+                encounter_columns(rows),
+                out_dir,
+                format="parquet",
+                partitioning=PARTITIONING,
+                basename_template=f"part-{cell:08d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            exported += sum(1 for row in rows if row[0] > state["last_id"])
+            state["last_id"] = rows[-1][0]
+            _write_state(out_dir, state)
+    finally:
+        conn.close()
+    return {"exported": exported, "last_id": state["last_id"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export saved encounters to month-partitioned Parquet")
+    parser.add_argument("--db", default=DB_PATH, help="Encounter database (default: %(default)s)")
+    parser.add_argument("--out", default=EXPORT_DIR, help="Parquet dataset directory (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Encounters per file cell (first export only)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No encounter database at {args.db}", file=sys.stderr)
+        return 1
+    result = export_encounters(args.db, args.out, args.chunk_size)
+    print(f"Exported {result['exported']:,} encounters (through #{result['last_id']}) to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""SQLite store for encounters saved from the EHR app.
+
+Each encounter is one row: the fields used for lookups (patient ID, MRN,
+encounter date, provider, type) in indexed columns, and the full encounter
+dict as JSON. The database runs in WAL mode, so readers never block the
+writer and several app processes can share one file.
+
+Saves from all sessions in a process go through one writer thread, which
+commits whatever has queued up in a single transaction (group commit).
+
+``latest_for_patient`` serves each patient's newest encounter from a
+per-process LRU. Before every lookup the store reads the rows added since
+it last looked (by any process) and drops those patients' entries, so a
+cached summary is never older than the latest save.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from queue import Queue, Empty
+from concurrent.futures import Future
+
+from metrics import stage_timer, record_cache
+
+# SQLite file inside the repo (EHR_DB_PATH points elsewhere)
+DB_PATH = os.environ.get("EHR_DB_PATH") or os.path.join(
+    os.path.dirname(__file__), "data", "encounters.db"
+)
+
+# Largest number of queued saves committed in one transaction
+WRITE_BATCH_SIZE = 500
+# Milliseconds a connection waits for another process's write lock
+BUSY_TIMEOUT_MS = 10000
+# Patients whose latest encounter is kept in memory per process
+SUMMARY_CACHE_SIZE = int(os.environ.get("EHR_SUMMARY_CACHE_SIZE", "1024"))
+
+INDEXED_FIELDS = ("patient_id", "mrn", "encounter_date", "provider", "encounter_type")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS encounters (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT,
+    mrn TEXT,
+    encounter_date TEXT,
+    provider TEXT,
+    encounter_type TEXT,
+    saved_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS encounters_patient ON encounters (patient_id, encounter_date, id);
+CREATE INDEX IF NOT EXISTS encounters_mrn ON encounters (mrn, encounter_date, id);
+CREATE INDEX IF NOT EXISTS encounters_date ON encounters (encounter_date, id);
+CREATE INDEX IF NOT EXISTS encounters_provider ON encounters (provider, encounter_date, id);
+"""
+
+
+def _key(value):
+    """Indexed column value: stripped text, or NULL when blank."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def patient_key(patient_id: str = None, mrn: str = None):
+    """Identity ``latest_for_patient`` looks up: the patient ID, else the MRN.
+
+    ``("patient_id", "P-1")`` / ``("mrn", "M-1")``, or None when both are blank.
+    """
+    if _key(patient_id):
+        return ("patient_id", _key(patient_id))
+    if _key(mrn):
+        return ("mrn", _key(mrn))
+    return None
+
+
+def _row(encounter: dict, saved_at: float) -> tuple:
+    return (
+        *(_key(encounter.get(field)) for field in INDEXED_FIELDS),
+        saved_at,
+        json.dumps(encounter, ensure_ascii=False, default=str),
+    )
+
+
+class EncounterStore:
+    """Encounters in one SQLite file, safe to share between threads and processes."""
+
+    def __init__(self, path: str = DB_PATH, summary_cache_size: int = SUMMARY_CACHE_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self._queue = Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with conn:
+            conn.executescript(SCHEMA)
+
+        # ("patient_id" | "mrn", value) -> latest encounter or None
+        self._summaries = OrderedDict()
+        self._summary_size = summary_cache_size
+        self._summary_lock = threading.Lock()
+        # Bumped on every invalidation, so a lookup that raced a save does
+        # not cache what it read
+        self._generation = 0
+        self._seen_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM encounters").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            # WAL + NORMAL: a commit survives an app crash; only a power loss
+            # can drop the last few transactions
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, rows: list) -> list:
+        """Insert rows in one transaction and return their IDs."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # The write lock is held, so new rows take consecutive IDs after
+            # the current maximum
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM encounters").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO encounters (patient_id, mrn, encounter_date, provider, encounter_type, saved_at, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return list(range(first, first + len(rows)))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                ids = self._insert([row for row, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                self._invalidate(row[:2] for row, _ in batch)
+                for (_, future), encounter_id in zip(batch, ids):
+                    future.set_result(encounter_id)
+
+    def save(self, encounter: dict) -> int:
+        """Store one encounter and return its ID once it is committed.
+
+        Saves arriving from other sessions at the same time are committed
+        together with this one.
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="encounter-writer", daemon=True)
+                self._writer.start()
+        with stage_timer("encounter_save"):
+            future = Future()
+            self._queue.put((_row(encounter, time.time()), future))
+            return future.result()
+
+    def save_many(self, encounters) -> list:
+        """Store many encounters in one transaction and return their IDs."""
+        saved_at = time.time()
+        rows = [_row(e, saved_at) for e in encounters]
+        ids = self._insert(rows)
+        self._invalidate(row[:2] for row in rows)
+        return ids
+
+    def get(self, encounter_id: int):
+        """One encounter by ID, or None."""
+        row = self._connection().execute(
+            "SELECT id, saved_at, data FROM encounters WHERE id = ?", (encounter_id,)
+        ).fetchone()
+        return self._encounter(row) if row else None
+
+    def for_patient(self, patient_id: str = None, mrn: str = None, limit: int = 20) -> list:
+        """A patient's encounters, newest encounter date first.
+
+        Looks up by ``patient_id`` when given, otherwise by ``mrn``.
+        """
+        column, value = ("patient_id", _key(patient_id)) if _key(patient_id) else ("mrn", _key(mrn))
+        if value is None:
+            return []
+        rows = self._connection().execute(
+            f"SELECT id, saved_at, data FROM encounters WHERE {column} = ?"
+            " ORDER BY encounter_date DESC, id DESC LIMIT ?",
+            (value, limit),
+        ).fetchall()
+        return [self._encounter(row) for row in rows]
+
+    def latest_for_patient(self, patient_id: str = None, mrn: str = None):
+        """The patient's newest encounter (or None), from the summary cache.
+
+        Looks up by ``patient_id`` when given, otherwise by ``mrn``. The
+        returned dict is shared with the cache; copy it before changing it.
+        """
+        key = patient_key(patient_id, mrn)
+        if key is None:
+            return None
+
+        self._sync_summaries()
+        with self._summary_lock:
+            hit = key in self._summaries
+            if hit:
+                self._summaries.move_to_end(key)
+                encounter = self._summaries[key]
+            generation = self._generation
+        record_cache("patient_summary", hit)
+        if hit:
+            return encounter
+
+        rows = self.for_patient(limit=1, **{key[0]: key[1]})
+        encounter = rows[0] if rows else None
+        with self._summary_lock:
+            if generation == self._generation:
+                self._summaries[key] = encounter
+                while len(self._summaries) > self._summary_size:
+                    self._summaries.popitem(last=False)
+        return encounter
+
+    def _sync_summaries(self):
+        """Drop cached summaries of patients saved since the last check."""
+        with self._summary_lock:
+            seen = self._seen_id
+        rows = self._connection().execute(
+            "SELECT id, patient_id, mrn FROM encounters WHERE id > ?", (seen,)
+        ).fetchall()
+        if rows:
+            self._invalidate((patient_id, mrn) for _, patient_id, mrn in rows)
+            with self._summary_lock:
+                self._seen_id = max(self._seen_id, rows[-1][0])
+
+    def _invalidate(self, patients):
+        """Forget cached summaries for ``(patient_id, mrn)`` pairs."""
+        with self._summary_lock:
+            self._generation += 1
+            for patient_id, mrn in patients:
+                self._summaries.pop(("patient_id", patient_id), None)
+                self._summaries.pop(("mrn", mrn), None)
+
+    def for_provider(self, provider: str, start: str = None, end: str = None, limit: int = 100) -> list:
+        """A provider's encounters dated ``start``..``end`` (ISO dates, inclusive)."""
+        rows = self._connection().execute(
+            "SELECT id, saved_at, data FROM encounters WHERE provider = ?"
+            " AND encounter_date >= ? AND encounter_date <= ?"
+            " ORDER BY encounter_date DESC, id DESC LIMIT ?",
+            (_key(provider), start or "", end or "\uffff", limit),
+        ).fetchall()
+        return [self._encounter(row) for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM encounters").fetchone()[0]
+
+    @staticmethod
+    def _encounter(row) -> dict:
+        encounter_id, saved_at, data = row
+        encounter = json.loads(data)
+        encounter["encounter_id"] = encounter_id
+        encounter["saved_at"] = saved_at
+        return encounter
+
+
+@lru_cache(maxsize=None)
+def get_encounter_store(path: str = DB_PATH) -> EncounterStore:
+    """Process-wide store for ``path``."""
+    return EncounterStore(path)
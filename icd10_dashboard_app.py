@@ -1,5 +1,7 @@
+import time
 import streamlit as st
-from icd10_utils import search_icd10, load_icd10
+from metrics import metrics_sidebar, observe, stage_timer
+from icd10_utils import ICD10SearchSession, icd10_children, icd10_scope_counts, format_icd10_code
 
 st.set_page_config(
     page_title="ICD-10 Code Explorer – Hanvion Health",
@@ -7,6 +9,8 @@ st.set_page_config(
     layout="wide",
 )
 
+rerun_started = time.perf_counter()
+
 st.title("ICD-10 Code Explorer")
 st.markdown("#### Hanvion Health – CMS Section 111 Valid ICD-10 (Jan 2026)")
 
@@ -17,18 +21,71 @@ st.write(
 
 with st.sidebar:
     st.header("Search & Filters")
-    query = st.text_input("Search by code or diagnosis text")
+    view = st.radio("View", ["Search", "Browse by code"], index=0, horizontal=True)
+    query = st.text_input("Search by code or diagnosis text", disabled=view != "Search")
     scope = st.radio("Code set", ["All", "Included", "Excluded"], index=0)
-    show_rows = st.slider("Max rows to display", 10, 200, 50, step=10)
+    page_size = st.slider("Rows per page", 10, 200, 50, step=10)
+
+metrics_sidebar()
+
+# Per-user search state, so each keystroke refines the previous result
+if "icd10_search" not in st.session_state:
+    st.session_state.icd10_search = ICD10SearchSession()
+icd10_search = st.session_state.icd10_search
 
-df = search_icd10(query, scope=scope)
+results = None
+if view == "Search":
+    results = icd10_search.query(query, scope=scope)
+    result_key = (view, query, scope)
+    counts = icd10_scope_counts()
+    summary = (
+        f"{results.total:,} matching rows "
+        f"({scope} code set: {counts[scope]:,} of {counts['All']:,} codes)"
+    )
+else:
+    # Walk category -> subcategory -> code, loading one level at a time
+    path = ""
+    for level in range(5):
+        children = icd10_children(path)
+        if children.empty:
+            break
+        labels = {
+            f"{row.DISPLAY} – {row.DESCRIPTION}" if row.BILLABLE else f"{row.DISPLAY} ({row.CODES} codes)": row.CODE
+            for row in children.itertuples()
+        }
+        choice = st.selectbox(
+            "Category" if level == 0 else f"Level {level + 1}",
+            ["(all)"] + list(labels),
+            key=f"browse_{level}",
+        )
+        if choice not in labels:
+            break
+        path = labels[choice]
 
-st.caption(f"Showing {min(len(df), show_rows)} of {len(df):,} matching rows.")
+    if path:
+        results = icd10_search.query(format_icd10_code(path), scope=scope)
+        result_key = (view, path, scope)
+        summary = f"{results.total:,} codes under {format_icd10_code(path)}"
 
-st.dataframe(df.head(show_rows), use_container_width=True)
+if results is not None:
+    # Only the rows of the current page are ever built or sent to the browser
+    pages = max(1, -(-results.total // page_size))
+    if st.session_state.get("page_for") != result_key or st.session_state.get("page", 1) > pages:
+        st.session_state.page_for = result_key
+        st.session_state.page = 1
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key="page")
+    offset = (page - 1) * page_size
+
+    st.caption(
+        f"Showing rows {min(offset + 1, results.total):,}–{min(offset + page_size, results.total):,} of {summary}."
+    )
+    with stage_timer("dashboard_render_page"):
+        st.dataframe(results.page(offset, page_size), use_container_width=True)
 
 st.markdown("---")
 st.markdown(
     "Data source: CMS Section 111 valid ICD-10 file (Jan 2026). "
     "This tool is for educational and internal use only and does not replace official CMS publications."
 )
+
+observe("dashboard_rerun", time.perf_counter() - rerun_started)
@@ -0,0 +1,339 @@
+"""Several CMS ICD-10 releases side by side, and diffs between them.
+
+Releases are found next to the current file (``ICD_PATH``): every
+``section111validicd10-<mon><yyyy>...xlsx`` in that folder is a release
+named ``YYYY-MM``, in force from the first of that month. A JSON manifest
+(``data/icd10_releases.json``, or the file in ``ICD10_RELEASES``) can add
+or override entries::
+
+    [{"name": "2025-10", "path": "section111-oct2025.xlsx", "effective": "2025-10-01"}]
+
+Each release is read from its Parquet cache and its rows are interned in
+one shared pool keyed by a hash of the row, so a row that is the same in
+every release is stored once and a release is just an array of pool row
+ids. The current release is the pool's first segment, shared with
+``load_icd10()``; an older release adds only the rows it changed. Diffs join two releases on the code (a pandas hash join) and only
+compare rows whose pool ids differ.
+
+    python icd10_releases.py list
+    python icd10_releases.py diff 2025-10 2026-01 -o changes.csv
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from icd10_utils import ICD_PATH, _icd10_columns, _nf_column, load_icd10, normalize_icd10_code, read_icd10
+from metrics import timed
+
+RELEASES_PATH = os.environ.get("ICD10_RELEASES") or os.path.join(os.path.dirname(ICD_PATH), "icd10_releases.json")
+RELEASE_FILE_RE = re.compile(
+    r"section111validicd10-(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[-_]?(\d{4})", re.IGNORECASE
+)
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_REDESCRIBED = "redescribed"
+CHANGE_NF_EXCLUDED = "nf_excluded"  # moved into NF exclusion
+CHANGE_NF_INCLUDED = "nf_included"  # moved out of NF exclusion
+
+
+class ICD10Release:
+    __slots__ = ("name", "path", "effective")
+
+    def __init__(self, name: str, path: str, effective: date):
+        self.name = name
+        self.path = path
+        self.effective = effective
+
+    def __repr__(self):
+        return f"ICD10Release({self.name!r}, effective={self.effective})"
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def release_from_filename(path: str):
+    """Release for a CMS file named like "section111validicd10-jan2026...", or None."""
+    m = RELEASE_FILE_RE.search(os.path.basename(path))
+    if m is None:
+        return None
+    month, year = MONTHS.index(m.group(1).lower()) + 1, int(m.group(2))
+    return ICD10Release(f"{year}-{month:02d}", path, date(year, month, 1))
+
+
+def discover_releases(data_dir: str = None, manifest: str = RELEASES_PATH) -> list:
+    """Releases in ``data_dir`` and the manifest, oldest first."""
+    data_dir = data_dir or os.path.dirname(ICD_PATH)
+    releases = {}
+    if os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            if name.lower().endswith(".xlsx"):
+                release = release_from_filename(os.path.join(data_dir, name))
+                if release is not None:
+                    releases[release.name] = release
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            for entry in json.load(f):
+                path = os.path.join(os.path.dirname(os.path.abspath(manifest)), entry["path"])
+                releases[entry["name"]] = ICD10Release(entry["name"], path, _as_date(entry["effective"]))
+    return sorted(releases.values(), key=lambda r: (r.effective, r.name))
+
+
+class ICD10RowPool:
+    """Distinct ICD-10 rows across releases, stored once.
+
+    Rows live in segments: each ``add`` appends one segment holding only
+    the rows no earlier release had, and returns the pool row ids of the
+    release's rows. A release whose rows are all new and already in the
+    pool's columns (the current file, added first) becomes a segment as
+    it is, so the pool shares that frame instead of copying it.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.segments = []
+        self.starts = np.zeros(1, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self._lookup = pd.Index(self.hashes)
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _canonical(self, df: pd.DataFrame) -> pd.DataFrame:
+        """The four pooled columns of a release, renamed to the pool's names."""
+        code_col, short_col, long_col = _icd10_columns(df)
+        nf_col = _nf_column(df)
+        out = pd.DataFrame({
+            self.columns[0]: df[code_col],
+            self.columns[1]: df[short_col],
+            self.columns[2]: df[long_col],
+            self.columns[3]: df[nf_col] if nf_col is not None else None,
+        })
+        return out.astype("str").where(out.notna(), None).reset_index(drop=True)
+
+    def add(self, df: pd.DataFrame) -> np.ndarray:
+        rows = self._canonical(df)
+        hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+        ids = self._lookup.get_indexer(hashes)
+
+        new = np.flatnonzero(ids < 0)
+        if len(new):
+            # Rows repeated within the release itself are added once, in file order
+            _, first = np.unique(hashes[new], return_index=True)
+            keep = new[np.sort(first)]
+            if len(keep) == len(df) and list(df.columns) == self.columns:
+                segment = df.reset_index(drop=True)
+            else:
+                segment = rows.take(keep).reset_index(drop=True)
+            start = len(self)
+            self.segments.append(segment)
+            self.starts = np.append(self.starts, start + len(keep))
+            self.hashes = np.concatenate([self.hashes, hashes[keep]])
+            self._lookup = pd.Index(self.hashes)
+            ids[new] = self._lookup.get_indexer(hashes[new])
+        return ids.astype(np.int32)
+
+    def take(self, ids, columns=None) -> pd.DataFrame:
+        """Pool rows ``ids``, in that order, as one DataFrame."""
+        ids = np.asarray(ids, dtype=np.int64)
+        columns = list(columns or self.columns)
+        segment = np.searchsorted(self.starts, ids, side="right") - 1
+        parts, order = [], []
+        for seg in np.unique(segment):
+            positions = np.flatnonzero(segment == seg)
+            parts.append(self.segments[seg][columns].take(ids[positions] - self.starts[seg]))
+            order.append(positions)
+        if not parts:
+            return pd.DataFrame({col: pd.Series(dtype="str") for col in columns})
+        if len(parts) == 1:
+            return parts[0].reset_index(drop=True)
+        out = pd.concat(parts, ignore_index=True)
+        return out.take(np.argsort(np.concatenate(order), kind="stable")).reset_index(drop=True)
+
+
+class ICD10ReleaseRegistry:
+    """Registered releases, loaded into a shared row pool on first use."""
+
+    def __init__(self, releases: list = None):
+        releases = releases if releases is not None else discover_releases()
+        self.releases = {r.name: r for r in releases}
+        current = next((r for r in releases if os.path.abspath(r.path) == os.path.abspath(ICD_PATH)), None)
+        if current is None:
+            current = release_from_filename(ICD_PATH) or ICD10Release("current", ICD_PATH, date.min)
+            self.releases[current.name] = current
+        self.current = current.name
+        self._order = sorted(self.releases.values(), key=lambda r: (r.effective, r.name))
+        self._effective = np.array([r.effective.toordinal() for r in self._order])
+        self._pool = None
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> list:
+        """Release names, oldest first."""
+        return [r.name for r in self._order]
+
+    def resolve(self, release: str = None, as_of=None) -> str:
+        """Name of ``release``, or of the release in force on ``as_of``.
+
+        Dates before the earliest release use the earliest; with neither
+        argument, the current release.
+        """
+        if release is not None:
+            if release not in self.releases:
+                raise ValueError(f"Unknown ICD-10 release {release!r}; known: {', '.join(self.names())}")
+            return release
+        if as_of is None:
+            return self.current
+        day = _as_date(as_of).toordinal()
+        return self._order[max(int(np.searchsorted(self._effective, day, side="right")) - 1, 0)].name
+
+    def releases_for_dates(self, dates) -> np.ndarray:
+        """Release in force for each date; missing or bad dates get the current release."""
+        parsed = pd.to_datetime(pd.Series(dates), errors="coerce")
+        names = np.array(self.names(), dtype=object)
+        days = parsed.dt.date.map(lambda d: d.toordinal() if pd.notna(d) else -1).to_numpy(dtype=np.int64)
+        pos = np.maximum(np.searchsorted(self._effective, days, side="right") - 1, 0)
+        return np.where(days >= 0, names[pos], self.current)
+
+    @timed("icd10_release_load")
+    def rows(self, release: str) -> np.ndarray:
+        """Pool row ids of a release, loading it on first use."""
+        name = self.resolve(release)
+        if name in self._rows:
+            return self._rows[name]
+        with self._lock:
+            if name in self._rows:
+                return self._rows[name]
+            if self._pool is None:
+                # The current release goes in first, so its frame (the
+                # one load_icd10 returns) is the pool's first segment
+                current = load_icd10()
+                code_col, short_col, long_col = _icd10_columns(current)
+                self._pool = ICD10RowPool([code_col, short_col, long_col, _nf_column(current) or "NF EXCL"])
+                self._rows[self.current] = self._pool.add(current)
+            if name not in self._rows:
+                self._rows[name] = self._pool.add(read_icd10(self.releases[name].path))
+        return self._rows[name]
+
+    @property
+    def pool(self) -> ICD10RowPool:
+        if self._pool is None:
+            self.rows(self.current)
+        return self._pool
+
+    def frame(self, release: str) -> pd.DataFrame:
+        """A release as a DataFrame with the current file's column names.
+
+        The current release is ``load_icd10()`` itself; any other release
+        is assembled from the pool, a new frame on each call.
+        """
+        name = self.resolve(release)
+        if name == self.current:
+            return load_icd10()
+        return self.pool.take(self.rows(name))
+
+    @timed("icd10_release_diff")
+    def diff(self, old: str, new: str) -> pd.DataFrame:
+        """Codes added, removed, re-described or moved in/out of NF exclusion.
+
+        One row per change: CODE, CHANGE and the OLD / NEW value (the long
+        description, or for NF changes the NF EXCL flag).
+        """
+        old_rows, new_rows = self.rows(old), self.rows(new)
+        pool = self.pool
+        code_col, short_col, long_col, nf_col = pool.columns
+
+        def codes_of(rows):
+            return pool.take(rows, [code_col])[code_col].map(normalize_icd10_code).to_numpy(dtype=object)
+
+        joined = pd.merge(
+            pd.DataFrame({"CODE": codes_of(old_rows), "OLD_ROW": old_rows}),
+            pd.DataFrame({"CODE": codes_of(new_rows), "NEW_ROW": new_rows}),
+            on="CODE",
+            how="outer",
+        )
+        # Same pool row means an identical row: nothing to compare
+        joined = joined[joined["OLD_ROW"].ne(joined["NEW_ROW"])]
+        old_present, new_present = joined["OLD_ROW"].notna(), joined["NEW_ROW"].notna()
+
+        both = joined[old_present & new_present]
+        before = pool.take(both["OLD_ROW"])
+        after = pool.take(both["NEW_ROW"])
+        codes = both["CODE"].reset_index(drop=True)
+
+        redescribed = before[short_col].ne(after[short_col]) | before[long_col].ne(after[long_col])
+        old_nf, new_nf = before[nf_col].notna(), after[nf_col].notna()
+
+        def changes(kind, codes, old, new):
+            return pd.DataFrame({"CODE": codes, "CHANGE": kind, "OLD": old, "NEW": new})
+
+        removed = joined[old_present & ~new_present]
+        added = joined[new_present & ~old_present]
+        parts = [
+            changes(CHANGE_ADDED, added["CODE"], None,
+                    pool.take(added["NEW_ROW"], [long_col])[long_col].to_numpy()),
+            changes(CHANGE_REMOVED, removed["CODE"],
+                    pool.take(removed["OLD_ROW"], [long_col])[long_col].to_numpy(), None),
+            changes(CHANGE_REDESCRIBED, codes[redescribed],
+                    before[long_col][redescribed], after[long_col][redescribed]),
+            changes(CHANGE_NF_EXCLUDED, codes[~old_nf & new_nf], None, after[nf_col][~old_nf & new_nf]),
+            changes(CHANGE_NF_INCLUDED, codes[old_nf & ~new_nf], before[nf_col][old_nf & ~new_nf], None),
+        ]
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return pd.DataFrame(columns=["CODE", "CHANGE", "OLD", "NEW"])
+        result = pd.concat(parts, ignore_index=True)
+        return result.sort_values(["CODE", "CHANGE"], kind="stable").reset_index(drop=True)
+
+
+@lru_cache(maxsize=1)
+def get_release_registry() -> ICD10ReleaseRegistry:
+    """Release registry for this process (see ``discover_releases``)."""
+    return ICD10ReleaseRegistry()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CMS ICD-10 releases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List registered releases")
+    p_diff = sub.add_parser("diff", help="Changes between two releases")
+    p_diff.add_argument("old", help="Earlier release name, e.g. 2025-10")
+    p_diff.add_argument("new", help="Later release name")
+    p_diff.add_argument("-o", "--output", default="-", help="Output CSV (default: stdout)")
+    args = parser.parse_args(argv)
+
+    registry = get_release_registry()
+    if args.command == "list":
+        for name in registry.names():
+            release = registry.releases[name]
+            marker = "*" if name == registry.current else " "
+            print(f"{marker} {name:10s} from {release.effective}  {release.path}")
+        return 0
+
+    try:
+        changes = registry.diff(args.old, args.new)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    changes.to_csv(sys.stdout if args.output == "-" else args.output, index=False)
+    counts = changes["CHANGE"].value_counts()
+    print(", ".join(f"{kind}: {n:,}" for kind, n in counts.items()) or "no changes", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""Shared ICD-10 lookup service.
+
+Loads the code set and its search index once and answers search, prefix,
+children and validate calls over HTTP (TCP or a Unix socket), so several
+Streamlit workers can share one warm index instead of each holding their
+own copy.
+
+Run the service:
+
+    python icd10_service.py --port 8765
+    python icd10_service.py --unix /tmp/icd10.sock
+
+and point the apps at it with ``ICD10_SERVICE_URL=http://127.0.0.1:8765``
+(or ``unix:///tmp/icd10.sock``); ``icd10_utils`` then forwards lookups to
+the service.
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, parse_qs, urlencode, unquote
+
+import pandas as pd
+
+import icd10_utils
+from json_http import serve_connection
+from metrics import stage_timer
+
+DEFAULT_PORT = 8765
+# Rows per /search response when the request gives no limit
+SEARCH_LIMIT = 50
+# Rows per request when the client pulls a whole result set
+SEARCH_PAGE_ROWS = 5000
+# Idle keep-alive connections a client keeps for reuse
+POOL_SIZE = int(os.environ.get("ICD10_SERVICE_POOL", "8"))
+
+def _frame_payload(df: pd.DataFrame, total: int) -> dict:
+    values = df.astype(object).where(df.notna(), None).values.tolist()
+    return {"total": total, "columns": list(df.columns), "data": values}
+
+
+def _payload_frame(payload: dict) -> pd.DataFrame:
+    return pd.DataFrame(payload["data"], columns=payload["columns"])
+
+
+class ICD10Service:
+    """Request handlers over one shared index and search session."""
+
+    def __init__(self, index: icd10_utils.ICD10Index = None):
+        self.index = index or icd10_utils.get_icd10_index()
+        # Shared by all clients: popular queries and page fetches hit its LRU
+        self.session = icd10_utils.ICD10SearchSession(max_entries=1024, index=self.index)
+
+    def dispatch(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        offset = int(params.get("offset", 0))
+        limit = int(params["limit"]) if "limit" in params else None
+
+        if method == "GET" and url.path == "/health":
+            return 200, {"ready": True, "rows": len(self.index)}
+
+        if method == "GET" and url.path == "/search":
+            results = self.session.query(
+                params.get("q", ""),
+                scope=params.get("scope", "All"),
+                ranked=params.get("ranked") == "1",
+                k=int(params.get("k", 50)),
+            )
+            page = results.page(offset, SEARCH_LIMIT if limit is None else limit)
+            return 200, _frame_payload(page, results.total)
+
+        if method == "GET" and url.path == "/prefix":
+            rows = self.index.code_prefix(params.get("code", ""))
+            end = len(rows) if limit is None else offset + limit
+            return 200, _frame_payload(self.index.df.iloc[rows[offset:end]], len(rows))
+
+        if method == "GET" and url.path == "/children":
+            children = self.index.code_children(params.get("code", ""))
+            return 200, _frame_payload(children, len(children))
+
+        if method == "GET" and url.path == "/counts":
+            return 200, self.index.scope_counts()
+
+        if method == "POST" and url.path == "/validate":
+            codes = json.loads(body or b"{}").get("codes", [])
+            result = icd10_utils.validate_icd10_codes(codes, index=self.index)
+            return 200, _frame_payload(result, len(result))
+
+        return 404, {"error": f"no route for {method} {url.path}"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one keep-alive connection."""
+        loop = asyncio.get_running_loop()
+
+        async def dispatch(method, target, body):
+            # Searches and validation are CPU-bound; run them on the
+            # default thread pool so the loop keeps serving other clients
+            return await loop.run_in_executor(None, self.dispatch, method, target, body)
+
+        await serve_connection(reader, writer, dispatch)
+
+
+async def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_path: str = None):
+    service = ICD10Service()
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        server = await asyncio.start_unix_server(service.handle, path=unix_path)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    where = unix_path or f"{host}:{port}"
+    print(f"ICD-10 service ready on {where} ({len(service.index):,} codes)", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class RemoteICD10Results:
+    """``ICD10Results`` look-alike that fetches pages from the service."""
+
+    def __init__(self, client, params: dict):
+        self.client = client
+        self.params = params
+        first = client._get("/search", {**params, "offset": 0, "limit": 0})
+        self.total = first["total"]
+        self.columns = first["columns"]
+
+    def __len__(self):
+        return self.total
+
+    def page(self, offset: int = 0, limit: int = 50) -> pd.DataFrame:
+        payload = self.client._get("/search", {**self.params, "offset": max(offset, 0), "limit": max(limit, 0)})
+        return _payload_frame(payload)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, chunk_size: int = 1000):
+        for offset in range(0, self.total, chunk_size):
+            yield from self.page(offset, chunk_size).to_dict("records")
+
+
+class ICD10ServiceClient:
+    """Client for ``ICD10Service`` over a small pool of keep-alive connections.
+
+    The pool is shared by all threads. Streamlit runs each rerun on a new
+    script thread, so per-thread connections would never be reused;
+    pooled ones stay warm across reruns and sessions.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, max_idle: int = POOL_SIZE):
+        self.url = url
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        parts = urlsplit(self.url)
+        if parts.scheme == "unix":
+            return _UnixHTTPConnection(unquote(parts.path), self.timeout)
+        return http.client.HTTPConnection(parts.hostname, parts.port or DEFAULT_PORT, timeout=self.timeout)
+
+    def _acquire(self, fresh: bool = False) -> http.client.HTTPConnection:
+        if not fresh:
+            with self._lock:
+                if self._idle:
+                    return self._idle.pop()
+        return self._new_connection()
+
+    def _release(self, conn: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _request(self, method: str, path: str, body: bytes = None) -> dict:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        # A pooled connection may have been closed by the server; the
+        # retry uses a new one
+        for attempt in range(2):
+            conn = self._acquire(fresh=attempt > 0)
+            try:
+                with stage_timer("icd10_service_request"):
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    payload = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException, OSError):
+                conn.close()
+                if attempt:
+                    raise
+        self._release(conn)
+        if response.status != 200:
+            raise RuntimeError(f"ICD-10 service error {response.status}: {payload.get('error')}")
+        return payload
+
+    def _get(self, path: str, params: dict = None) -> dict:
+        return self._request("GET", f"{path}?{urlencode(params or {})}")
+
+    def health(self) -> dict:
+        return self._get("/health")
+
+    def search(self, query: str = "", scope: str = "All", ranked: bool = False, k: int = 50) -> pd.DataFrame:
+        """All matching rows, like ``search_icd10``, fetched page by page."""
+        results = self.query(query, scope, ranked, k)
+        pages = [results.page(offset, SEARCH_PAGE_ROWS) for offset in range(0, results.total, SEARCH_PAGE_ROWS)]
+        if not pages:
+            return pd.DataFrame(columns=results.columns)
+        return pd.concat(pages, ignore_index=True)
+
+    def query(self, query: str = "", scope: str = "All", ranked: bool = False, k: int = 50) -> RemoteICD10Results:
+        return RemoteICD10Results(self, {"q": query, "scope": scope, "ranked": int(ranked), "k": k})
+
+    def prefix(self, code: str) -> pd.DataFrame:
+        return _payload_frame(self._get("/prefix", {"code": code}))
+
+    def children(self, code: str = "") -> pd.DataFrame:
+        return _payload_frame(self._get("/children", {"code": code}))
+
+    def scope_counts(self) -> dict:
+        return self._get("/counts")
+
+    def validate(self, codes) -> pd.DataFrame:
+        body = json.dumps({"codes": [None if pd.isna(c) else str(c) for c in codes]}).encode()
+        return _payload_frame(self._request("POST", "/validate", body))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared ICD-10 lookup service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Listen on this Unix socket path instead of TCP")
+    args = parser.parse_args(argv)
+
+    # The service answers from its own index, never from another service
+    os.environ.pop("ICD10_SERVICE_URL", None)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
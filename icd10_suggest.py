@@ -0,0 +1,409 @@
+"""Suggest ICD-10 codes from free-text clinical notes.
+
+Every short and long description in ``load_icd10()`` is compiled once into
+a word-level Aho-Corasick automaton, so a note is scanned in one pass over
+its tokens whatever the number of descriptions. Candidates are then ranked
+in a few passes over the matches:
+
+1. phrase matches: whole descriptions, each long description's head
+   (the text before its first comma: "Cholera, unspecified" -> "cholera"),
+   its core phrase with generic qualifiers removed ("Essential (primary)
+   hypertension" -> "essential hypertension", "Unspecified acute
+   appendicitis" -> "acute appendicitis", "... with exacerbation" cut off)
+   and common note terms such as "COPD", weighted by the rarity (IDF) of
+   the words they cover; among equal scores the unspecified code, then
+   the shorter description, comes first;
+2. matches inside a longer match ("diabetes mellitus" inside "type 2
+   diabetes mellitus without complications") count for little;
+3. matches shortly after a negation cue in the same sentence ("denies
+   chest pain") are flagged and count for little;
+4. codes written in the note ("E11.9") are taken as they are.
+
+    from icd10_suggest import suggest_icd10
+    suggest_icd10("Known type 2 diabetes mellitus without complications, denies chest pain")
+
+For large note corpora, ``suggest_icd10_batch`` spreads notes across a
+process pool, and the command line does the same for a JSONL or CSV file:
+
+    python icd10_suggest.py notes.jsonl -o suggestions.jsonl --workers 8
+"""
+import os
+import re
+import sys
+import json
+import math
+import argparse
+import multiprocessing
+from array import array
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from icd10_utils import TOKEN_PATTERN, _icd10_columns, load_icd10, normalize_icd10_code
+from metrics import timed, record_rows
+
+# Weight of a match by the kind of pattern it hit
+LONG_WEIGHT = 1.0
+SHORT_WEIGHT = 0.9
+HEAD_WEIGHT = 0.6
+CORE_WEIGHT = 0.5
+# Heads and core phrases shared by more codes than this are too generic
+# to suggest from
+HEAD_MAX_ROWS = 20
+# Score factors for matches inside a longer match, or negated
+SUBSUMED_FACTOR = 0.25
+NEGATED_FACTOR = 0.2
+# Score of a code written out in the note
+CODE_MENTION_SCORE = 50.0
+
+NEGATION_CUES = {"no", "not", "denies", "denied", "deny", "negative", "without", "absent", "free", "ruled"}
+# A cue applies to matches starting within this many tokens after it
+NEGATION_WINDOW = 4
+SENTENCE_BREAK = re.compile(r"[.;:!?\n]")
+
+TOKEN_RE = re.compile(TOKEN_PATTERN)
+CODE_MENTION_RE = re.compile(r"\b[A-Z][0-9][0-9A-Z](?:\.?[0-9A-Z]{1,4})?\b")
+
+# Generic qualifiers dropped from a long description to get its core phrase
+PARENTHETICAL_RE = re.compile(r"\([^)]*\)")
+CLAUSE_RE = re.compile(r"\s(?:with|without|w/o)\s.*$")
+LEADING_QUALIFIER_RE = re.compile(r"^(?:unspecified|other specified|other)\s+")
+
+# Common note terms and abbreviations -> the core phrase they stand for
+NOTE_SYNONYMS = {
+    "hypertension": "essential hypertension",
+    "htn": "essential hypertension",
+    "copd": "chronic obstructive pulmonary disease",
+    "afib": "atrial fibrillation",
+    "a fib": "atrial fibrillation",
+    "uti": "urinary tract infection",
+    "gerd": "gastro esophageal reflux disease",
+    "hld": "hyperlipidemia",
+    "chf": "heart failure",
+}
+
+# Default note fields of a saved encounter, for the batch command
+NOTE_FIELDS = ["chief_complaint", "hpi", "assessment", "plan"]
+
+
+def core_phrase(description: str) -> str:
+    """A description without its generic qualifiers, lower-cased.
+
+    Drops parentheticals, everything from the first comma, a trailing
+    "with/without ..." clause and a leading "unspecified"/"other":
+    "Unspecified asthma with (acute) exacerbation" -> "asthma".
+    """
+    text = PARENTHETICAL_RE.sub(" ", description.lower()).split(",", 1)[0]
+    text = CLAUSE_RE.sub("", " ".join(text.split()))
+    return LEADING_QUALIFIER_RE.sub("", text)
+
+
+class ICD10PhraseMatcher:
+    """Word-level Aho-Corasick automaton over the ICD-10 descriptions.
+
+    States are integers. ``_goto`` maps ``state * stride + token`` to the
+    next state; ``_fail`` and ``_out`` are the failure and output links,
+    and ``_term`` maps a final state to its pattern. Each pattern (a
+    distinct token sequence) has a weight and the rows it describes,
+    ``pattern_rows[pattern_offsets[p]:pattern_offsets[p + 1]]``.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        code_col, short_col, long_col = _icd10_columns(df)
+        self.codes = df[code_col].astype(str).to_numpy(dtype=object)
+        self.descriptions = df[long_col].fillna(df[short_col]).astype(str).str.strip().to_numpy(dtype=object)
+        self._code_rows = {normalize_icd10_code(c): row for row, c in enumerate(self.codes)}
+
+        patterns = {}  # token tuple -> pattern id
+        pattern_rows = []
+        self.pattern_weight = []
+
+        def add(tokens, row, weight):
+            if not tokens:
+                return
+            pid = patterns.get(tokens)
+            if pid is None:
+                pid = patterns[tokens] = len(pattern_rows)
+                pattern_rows.append([])
+                self.pattern_weight.append(weight)
+            rows = pattern_rows[pid]
+            if not rows or rows[-1] != row:
+                rows.append(row)
+            self.pattern_weight[pid] = max(self.pattern_weight[pid], weight)
+
+        longs = df[long_col].fillna("").astype(str).str.lower()
+        shorts = df[short_col].fillna("").astype(str).str.lower()
+        heads = longs.str.split(",", n=1).str[0]
+        cores = longs.map(core_phrase)
+        for row, (long, short, head, core) in enumerate(zip(longs, shorts, heads, cores)):
+            add(tuple(TOKEN_RE.findall(long)), row, LONG_WEIGHT)
+            add(tuple(TOKEN_RE.findall(short)), row, SHORT_WEIGHT)
+            add(tuple(TOKEN_RE.findall(head)), row, HEAD_WEIGHT)
+            add(tuple(TOKEN_RE.findall(core)), row, CORE_WEIGHT)
+
+        # Drop generic heads and cores, keeping patterns that are a full description
+        for pid, rows in enumerate(pattern_rows):
+            if self.pattern_weight[pid] < SHORT_WEIGHT and len(rows) > HEAD_MAX_ROWS:
+                rows.clear()
+
+        # Note terms describe the same rows as the phrase they stand for
+        for term, phrase in NOTE_SYNONYMS.items():
+            pid = patterns.get(tuple(TOKEN_RE.findall(phrase)))
+            if pid is not None:
+                for row in list(pattern_rows[pid]):
+                    add(tuple(TOKEN_RE.findall(term)), row, self.pattern_weight[pid])
+        self.pattern_offsets = np.append(0, np.cumsum([len(rows) for rows in pattern_rows])).astype(np.int64)
+        self.pattern_rows = np.fromiter(
+            (row for rows in pattern_rows for row in rows), dtype=np.int32, count=int(self.pattern_offsets[-1])
+        )
+
+        # Word rarity over the long descriptions
+        doc_freq = {}
+        for long in longs:
+            for token in set(TOKEN_RE.findall(long)):
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        self.vocab = {token: i for i, token in enumerate(sorted({t for p in patterns for t in p}))}
+        n_docs = max(len(df), 1)
+        self.idf = [math.log1p(n_docs / doc_freq.get(token, 1)) for token in self.vocab]
+
+        self._build(patterns)
+
+    def _build(self, patterns: dict):
+        stride = self._stride = len(self.vocab) + 1
+        goto = {}
+        parent, token, depth = [0], [0], [0]
+        term = {}
+        for tokens, pid in patterns.items():
+            if self.pattern_offsets[pid] == self.pattern_offsets[pid + 1]:
+                continue
+            state = 0
+            for t in tokens:
+                t = self.vocab[t]
+                key = state * stride + t
+                nxt = goto.get(key)
+                if nxt is None:
+                    nxt = goto[key] = len(parent)
+                    parent.append(state)
+                    token.append(t)
+                    depth.append(depth[state] + 1)
+                state = nxt
+            term[state] = pid
+
+        # Failure and output links, breadth first
+        fail = [0] * len(parent)
+        out = [0] * len(parent)
+        for state in np.argsort(np.asarray(depth), kind="stable").tolist():
+            if depth[state] < 2:
+                continue
+            t = token[state]
+            f = fail[parent[state]]
+            while True:
+                nxt = goto.get(f * stride + t)
+                if nxt is not None:
+                    fail[state] = nxt
+                    break
+                if f == 0:
+                    break
+                f = fail[f]
+            f = fail[state]
+            out[state] = f if f in term else out[f]
+
+        self._goto, self._term = goto, term
+        self._fail, self._out, self._depth = array("i", fail), array("i", out), array("i", depth)
+
+    def __len__(self):
+        return len(self.pattern_weight)
+
+    def rows_for(self, pattern: int) -> np.ndarray:
+        """Rows a pattern describes."""
+        return self.pattern_rows[self.pattern_offsets[pattern]:self.pattern_offsets[pattern + 1]]
+
+    def matches(self, note: str):
+        """Phrase matches in a note as ``(pattern, first_token, end_token)``,
+        plus the note's token char spans and lower-cased tokens."""
+        spans, tokens = [], []
+        for m in TOKEN_RE.finditer(note.lower()):
+            spans.append(m.span())
+            tokens.append(m.group())
+
+        goto, fail, out, term, depth = self._goto, self._fail, self._out, self._term, self._depth
+        stride, vocab = self._stride, self.vocab
+        found = []
+        state = 0
+        for i, word in enumerate(tokens):
+            t = vocab.get(word)
+            if t is None:
+                state = 0
+                continue
+            while True:
+                nxt = goto.get(state * stride + t)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            hit = state if state in term else out[state]
+            while hit:
+                found.append((term[hit], i + 1 - depth[hit], i + 1))
+                hit = out[hit]
+        return found, spans, tokens
+
+    def _negated(self, note: str, spans, tokens, start: int) -> bool:
+        for i in range(max(start - NEGATION_WINDOW, 0), start):
+            if tokens[i] in NEGATION_CUES and not SENTENCE_BREAK.search(note, spans[i][1], spans[start][0]):
+                return True
+        return False
+
+    def suggest(self, note: str, k: int = 10) -> list:
+        """Top ``k`` candidate codes for a note, best first.
+
+        Each candidate is a dict with CODE, DESCRIPTION, SCORE, NEGATED
+        (every match of it was negated) and SPANS, the ``(start, end)``
+        character offsets of its matches in the note.
+        """
+        if not note or not note.strip():
+            return []
+        found, spans, tokens = self.matches(note)
+
+        # Pass 2: a match inside a longer one is subsumed
+        found.sort(key=lambda m: (m[1], -m[2]))
+        candidates = {}
+        reach = 0
+        for pid, start, end in found:
+            subsumed = end <= reach
+            reach = max(reach, end)
+            negated = self._negated(note, spans, tokens, start)
+            score = sum(self.idf[self.vocab[tokens[i]]] for i in range(start, end)) * self.pattern_weight[pid]
+            if subsumed:
+                score *= SUBSUMED_FACTOR
+            if negated:
+                score *= NEGATED_FACTOR
+            rows = self.rows_for(pid)
+            score /= math.sqrt(len(rows))
+            span = (spans[start][0], spans[end - 1][1])
+            for row in rows.tolist():
+                self._add(candidates, row, score, span, negated)
+
+        # Pass 4: codes written in the note
+        for m in CODE_MENTION_RE.finditer(note):
+            row = self._code_rows.get(normalize_icd10_code(m.group()))
+            if row is not None:
+                self._add(candidates, row, CODE_MENTION_SCORE, m.span(), False)
+
+        best = sorted(candidates.items(), key=lambda item: self._rank_key(*item))[:k]
+        return [
+            {
+                "CODE": self.codes[row],
+                "DESCRIPTION": self.descriptions[row],
+                "SCORE": round(c["SCORE"], 3),
+                "NEGATED": c["NEGATED"],
+                "SPANS": sorted(set(c["SPANS"])),
+            }
+            for row, c in best
+        ]
+
+    def _rank_key(self, row: int, candidate: dict):
+        # Equal scores: the unspecified code first (what a note without more
+        # detail is coded as), then the plainer description
+        description = self.descriptions[row]
+        return -round(candidate["SCORE"], 6), "unspecified" not in description.lower(), len(description)
+
+    @staticmethod
+    def _add(candidates: dict, row: int, score: float, span, negated: bool):
+        c = candidates.get(row)
+        if c is None:
+            candidates[row] = {"SCORE": score, "NEGATED": negated, "SPANS": [span]}
+        else:
+            c["SCORE"] += score
+            c["NEGATED"] = c["NEGATED"] and negated
+            c["SPANS"].append(span)
+
+
+@lru_cache(maxsize=1)
+@timed("icd10_suggest_build")
+def get_phrase_matcher() -> ICD10PhraseMatcher:
+    """Phrase matcher over ``load_icd10()``, built once per process."""
+    return ICD10PhraseMatcher(load_icd10())
+
+
+@timed("icd10_suggest")
+def suggest_icd10(note: str, k: int = 10) -> pd.DataFrame:
+    """Ranked ICD-10 suggestions for a note as a DataFrame (see ``suggest``)."""
+    suggestions = get_phrase_matcher().suggest(note, k)
+    record_rows("icd10_suggest", len(suggestions))
+    return pd.DataFrame(suggestions, columns=["CODE", "DESCRIPTION", "SCORE", "NEGATED", "SPANS"])
+
+
+# ---------------------------------------------------------
+# BATCH MODE
+# ---------------------------------------------------------
+def _worker_init():
+    # Forked workers inherit the parent's matcher; others build their own
+    get_phrase_matcher()
+
+
+def _suggest_one(args):
+    note_id, note, k = args
+    return note_id, get_phrase_matcher().suggest(note, k)
+
+
+def suggest_icd10_batch(notes, k: int = 10, workers: int = None, chunksize: int = 64):
+    """Yield ``(note_id, suggestions)`` for ``(note_id, text)`` pairs, in order.
+
+    Notes are scanned across ``workers`` processes (default: CPU count),
+    streamed in chunks so the corpus never has to fit in memory. Where
+    ``fork`` is available the matcher is built once here and shared with
+    the workers; otherwise each worker builds its own.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = ((note_id, note, k) for note_id, note in notes)
+    if workers == 1:
+        yield from map(_suggest_one, jobs)
+        return
+
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods:
+        get_phrase_matcher()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(workers, initializer=_worker_init) as pool:
+        yield from pool.imap(_suggest_one, jobs, chunksize)
+
+
+def _note_text(record: dict, fields) -> str:
+    return "\n".join(str(record[f]) for f in fields if record.get(f))
+
+
+def main(argv=None):
+    from adr_batch import iter_encounters
+
+    parser = argparse.ArgumentParser(description="Suggest ICD-10 codes for a file of clinical notes")
+    parser.add_argument("input", help="Notes or saved encounters as JSONL or CSV")
+    parser.add_argument("-o", "--output", default="-", help="JSONL suggestions (default: stdout)")
+    parser.add_argument("--text-field", action="append", dest="fields",
+                        help=f"Field holding note text; repeat for several (default: {', '.join(NOTE_FIELDS)})")
+    parser.add_argument("--id-field", default="id", help="Note ID field (default: position in file)")
+    parser.add_argument("--top", type=int, default=10, help="Suggestions per note")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=64, help="Notes per task sent to a worker")
+    args = parser.parse_args(argv)
+
+    fields = args.fields or NOTE_FIELDS
+    notes = ((note_id, _note_text(record, fields)) for note_id, record in iter_encounters(args.input, args.id_field))
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    count = 0
+    try:
+        for note_id, suggestions in suggest_icd10_batch(notes, args.top, args.workers, args.chunksize):
+            out.write(json.dumps({"id": note_id, "suggestions": suggestions}) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Suggested codes for {count:,} notes", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,51 +1,1050 @@
 import os
+import re
+import sys
+import bisect
+import shutil
+import hashlib
+import argparse
+import threading
+import numpy as np
 import pandas as pd
 from functools import lru_cache
+from collections import OrderedDict
 
-# Path to ICD-10 Excel file inside the repo
-ICD_PATH = os.path.join(
+from metrics import stage_timer, timed, record_rows, record_cache
+
+# Path to ICD-10 Excel file inside the repo (ICD10_PATH points elsewhere)
+ICD_PATH = os.environ.get("ICD10_PATH") or os.path.join(
     os.path.dirname(__file__),
     "data",
     "section111validicd10-jan2026_cms-updates-to-cms-gov.xlsx",
 )
 
-@lru_cache(maxsize=1)
-def load_icd10():
-    """Load ICD-10 dataset from the Excel file (cached)."""
-    df = pd.read_excel(ICD_PATH, engine="openpyxl")
+# Compiled Parquet copies of the Excel file live here, one per source hash
+CACHE_DIR = os.environ.get(
+    "ICD10_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "data", ".cache"),
+)
+
+# Shared-table mode (ICD10_SHARED_TABLE=1): every process memory-maps the
+# same Arrow file read-only. Point ICD10_SHARED_DIR at /dev/shm to keep it
+# in POSIX shared memory rather than the page cache of a disk file.
+SHARED_TABLE = os.environ.get("ICD10_SHARED_TABLE") == "1"
+SHARED_DIR = os.environ.get("ICD10_SHARED_DIR", CACHE_DIR)
+
+# Layout of the saved index arrays; bump when ICD10Index changes what
+# it stores or how (tokenizing, field weights) so stale files are not read
+INDEX_FORMAT = 2
+
+# Search indexes over releases other than the current one kept per process
+RELEASE_INDEX_CACHE_SIZE = int(os.environ.get("ICD10_RELEASE_INDEXES", 4))
+
+
+def _file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, used to key the compiled cache."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path_for(path: str = ICD_PATH, digest: str = None) -> str:
+    """Location of the compiled cache for a given source workbook."""
+    digest = digest or _file_digest(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{digest[:16]}.parquet")
+
+
+@timed("icd10_excel_read")
+def _read_excel(path: str) -> pd.DataFrame:
+    df = pd.read_excel(path, engine="openpyxl")
     df.columns = df.columns.str.strip()
     return df
 
-def search_icd10(query: str = "", scope: str = "All"):
-    """Search ICD-10 codes by code or text. Scope can be All/Included/Excluded."""
-    df = load_icd10()
 
-    # Try to detect NF EXCL column if present
-    nf_col = None
-    for col in df.columns:
-        if col.strip().upper().startswith("NF EXCL"):
-            nf_col = col
-            break
+def build_icd10_cache(path: str = ICD_PATH, force: bool = False) -> str:
+    """Compile the CMS workbook into a Parquet cache and return its path.
+
+    The cache file name carries the source hash, so a new CMS release
+    gets its own file and stale ones are never read.
+    """
+    target = cache_path_for(path)
+    if os.path.exists(target) and not force:
+        return target
+
+    df = _read_excel(path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write next to the target and rename so concurrent workers never
+    # see a half-written file.
+    tmp = f"{target}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, target)
+    return target
+
+
+def build_icd10_shared_table(path: str = ICD_PATH, force: bool = False) -> str:
+    """Write the code set as an uncompressed Arrow IPC file and return its path.
+
+    Every column is stored as a large_string array, i.e. an int64 offsets
+    buffer plus one UTF-8 bytes buffer, so it can be memory-mapped and
+    used in place without deserializing anything.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    parquet_path = cache_path_for(path)
+    target = os.path.join(SHARED_DIR, os.path.basename(parquet_path)[: -len(".parquet")] + ".arrow")
+    if os.path.exists(target) and not force:
+        return target
+
+    if not os.path.exists(parquet_path):
+        build_icd10_cache(path)
+    table = pa.Table.from_pandas(pd.read_parquet(parquet_path), preserve_index=False)
+    table = table.cast(pa.schema([pa.field(name, pa.large_string()) for name in table.column_names]))
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with ipc.new_file(tmp, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, target)
+    return target
+
+
+def map_icd10_shared_table(arrow_path: str) -> pd.DataFrame:
+    """DataFrame whose string columns point straight into a read-only mmap.
 
-    if nf_col is not None:
-        if scope == "Included":
-            df = df[df[nf_col].isna()]
-        elif scope == "Excluded":
-            df = df[~df[nf_col].isna()]
+    Pages are shared between all processes mapping the same file, so N
+    workers cost roughly one copy of the table. The search index is
+    shared the same way (see ``build_icd10_shared_index``).
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
 
-    if not query:
-        return df
+    table = ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+    return table.to_pandas(types_mapper=lambda _: pd.StringDtype("pyarrow"))
 
-    q = query.lower()
 
+def _shared_index_dir(path: str = ICD_PATH) -> str:
+    stem = os.path.basename(cache_path_for(path))[: -len(".parquet")]
+    return os.path.join(SHARED_DIR, f"{stem}.index-v{INDEX_FORMAT}")
+
+
+def build_icd10_shared_index(path: str = ICD_PATH, force: bool = False) -> str:
+    """Save the search index of the shared table as ``.npy`` files; return the folder.
+
+    Built over the memory-mapped table itself, so row ids line up with
+    what every worker maps. Workers then map these arrays too (see
+    ``map_icd10_shared_index``) instead of each building the index.
+    """
+    target = _shared_index_dir(path)
+    if os.path.isdir(target) and not force:
+        return target
+
+    df = map_icd10_shared_table(build_icd10_shared_table(path, force=force))
+    arrays = _build_index_arrays(df)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), arrays[name])
+    if force:
+        shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Another worker finished first; its copy is identical
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def map_icd10_shared_index(index_dir: str) -> dict:
+    """Index arrays memory-mapped read-only from ``build_icd10_shared_index``."""
+    return {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r") for name in INDEX_ARRAYS}
+
+
+def read_icd10(path: str = ICD_PATH) -> pd.DataFrame:
+    """Read a CMS workbook through its Parquet cache (not cached in memory).
+
+    Builds the cache on first use and falls back to parsing the workbook
+    directly if the cache cannot be read or written (e.g. read-only
+    filesystem). ``icd10_releases`` reads other releases with this.
+    """
+    try:
+        return pd.read_parquet(build_icd10_cache(path))
+    except (ImportError, OSError, ValueError):
+        return _read_excel(path)
+
+
+@lru_cache(maxsize=1)
+@timed("icd10_load")
+def load_icd10():
+    """Load the current ICD-10 dataset, ``ICD_PATH`` (cached).
+
+    See ``read_icd10``. With ICD10_SHARED_TABLE=1 the table is
+    memory-mapped from a shared Arrow file instead (see
+    ``map_icd10_shared_table``). Other CMS releases are held side by side
+    by ``icd10_releases``.
+    """
+    if SHARED_TABLE:
+        try:
+            return map_icd10_shared_table(build_icd10_shared_table(ICD_PATH))
+        except (ImportError, OSError, ValueError):
+            pass
+    return read_icd10(ICD_PATH)
+
+
+# Words are runs of letters/digits; everything else separates tokens
+TOKEN_PATTERN = r"[a-z0-9]+"
+
+# Something a coder would type as a code: "E11", "S72.0", "a0101"
+CODE_QUERY_RE = re.compile(r"^[A-Z][0-9][0-9A-Z](\.?[0-9A-Z]{0,4})?$")
+
+# Token weight per field (code, short, long) when ranking
+FIELD_WEIGHTS = (2.0, 2.0, 1.0)
+BM25_K1 = 1.2
+# Light length normalization: CMS descriptions run from two words to
+# twenty, and full normalization let "Diabetes insipidus" outrank every
+# diabetes mellitus code
+BM25_B = 0.3
+# Share of a token's score that depends on how much of the row's 3-character
+# category the token matches. "pneumonia" matches all of J18 but one row of
+# A01 (typhoid fever), so J18 rows keep their full score and A0103 about half
+CATEGORY_FOCUS_WEIGHT = 0.5
+
+# Score multipliers for how a query token matched an indexed token
+PREFIX_MATCH_WEIGHT = 0.7
+FUZZY_MATCH_WEIGHT = 0.5
+
+# Statuses returned by validate_icd10_codes
+CODE_VALID = "valid"
+CODE_INVALID = "invalid"
+CODE_NF_EXCLUDED = "nf_excluded"
+
+# Largest previous result a search-as-you-type session will refine
+REFINE_MAX_ROWS = 2000
+
+# ICD-10-CM categories are 3 characters; each level below adds one more
+CATEGORY_LENGTH = 3
+
+
+def _nf_column(df: pd.DataFrame):
+    """Name of the "NF EXCL" column if the file has one."""
+    for col in df.columns:
+        if col.strip().upper().startswith("NF EXCL"):
+            return col
+    return None
+
+
+def _icd10_columns(df: pd.DataFrame):
+    """Return (code, short, long) column names, tolerating renamed headers."""
     code_col = "CODE" if "CODE" in df.columns else df.columns[0]
     short_col = df.columns[1] if len(df.columns) > 1 else code_col
     long_col = df.columns[2] if len(df.columns) > 2 else short_col
+    return code_col, short_col, long_col
+
+
+def normalize_icd10_code(code) -> str:
+    """Canonical CMS form of a code: upper case, no dot ("e11.9" -> "E119")."""
+    return str(code).strip().upper().replace(".", "").replace(" ", "")
+
+
+def format_icd10_code(code) -> str:
+    """Dotted display form of a code ("E119" -> "E11.9")."""
+    code = normalize_icd10_code(code)
+    if len(code) > CATEGORY_LENGTH:
+        return f"{code[:CATEGORY_LENGTH]}.{code[CATEGORY_LENGTH:]}"
+    return code
+
+
+def _tokenize(text: str):
+    return re.findall(TOKEN_PATTERN, text.lower())
+
+
+class PackedStrings:
+    """Read-only sequence of ASCII strings in one bytes buffer plus offsets.
+
+    String ``i`` is ``data[offsets[i]:offsets[i + 1]]``. Both are plain
+    numpy arrays, so the whole sequence can live in a memory-mapped file
+    and be shared between processes; it also works with ``bisect``.
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings) -> "PackedStrings":
+        encoded = [s.encode("ascii") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("ascii")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+# Arrays an ICD10Index is made of; ``ICD10Index(df, arrays)`` attaches a
+# saved set instead of building one (see ``build_icd10_shared_index``)
+INDEX_ARRAYS = (
+    "text_data", "text_offsets", "vocab_data", "vocab_offsets",
+    "offsets", "postings", "tf", "doc_len", "idf", "codes", "code_rows",
+    "category", "category_size",
+)
+
+
+def _build_index_arrays(df: pd.DataFrame) -> dict:
+    code_col, short_col, long_col = _icd10_columns(df)
+
+    fields = [
+        df[col].fillna("").astype(str).str.lower().str.findall(TOKEN_PATTERN).reset_index(drop=True)
+        for col in (code_col, short_col, long_col)
+    ]
+
+    # One normalized text per row: its tokens, space separated, with a
+    # leading space so " " + token is a token-prefix test.
+    text = fields[0] + fields[1] + fields[2]
+    text = PackedStrings.pack(" " + text.str.join(" "))
+
+    # (token, row) pairs with a field-weighted term frequency
+    pairs = pd.concat(
+        [
+            tokens.explode().dropna().rename("token").rename_axis("row").reset_index().assign(tf=weight)
+            for tokens, weight in zip(fields, FIELD_WEIGHTS)
+        ],
+        ignore_index=True,
+    )
+    pairs = pairs.groupby(["token", "row"], sort=True)["tf"].sum().reset_index()
+
+    tokens = pairs["token"].to_numpy(dtype=object)
+    vocab, starts = np.unique(tokens, return_index=True)
+    vocab = PackedStrings.pack(vocab)
+    offsets = np.append(starts, len(tokens)).astype(np.int64)
+    postings = pairs["row"].to_numpy(dtype=np.int32)
+    tf = pairs["tf"].to_numpy(dtype=np.float32)
+
+    # BM25 statistics: weighted row length and per-token document frequency
+    doc_len = np.bincount(postings, weights=tf, minlength=len(df)).astype(np.float32)
+    doc_freq = np.diff(offsets)
+    idf = np.log1p((len(df) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    codes = df[code_col].astype(str).map(normalize_icd10_code).to_numpy(dtype=str)
+    order = np.argsort(codes, kind="stable")
+    # Category id per row (first three code characters)
+    _, category_ids = np.unique(codes[order].astype("<U3"), return_inverse=True)
+    category = np.empty(len(df), dtype=np.int32)
+    category[order] = category_ids
+    return {
+        "text_data": text.data, "text_offsets": text.offsets,
+        "vocab_data": vocab.data, "vocab_offsets": vocab.offsets,
+        "offsets": offsets, "postings": postings, "tf": tf, "doc_len": doc_len, "idf": idf,
+        "codes": codes[order], "code_rows": order.astype(np.int32),
+        "category": category, "category_size": np.bincount(category).astype(np.int32),
+    }
+
+
+class ICD10Index:
+    """In-memory inverted index over the code and description columns.
+
+    Postings are kept in CSR form: ``vocab`` is the sorted token list,
+    and the rows containing ``vocab[i]`` are
+    ``postings[offsets[i]:offsets[i + 1]]`` (sorted, unique row ids).
+    A query token matches every vocabulary token it is a prefix of, so
+    "diab" finds "diabetes"; multi-word queries intersect the postings.
+
+    Codes get their own sorted array (``codes``, with ``code_rows``
+    mapping back to row ids) so prefix lookups and hierarchy browsing
+    are binary-search range queries rather than scans.
+
+    Everything but small per-process caches is a flat numpy array
+    (``INDEX_ARRAYS``), so a saved set can be memory-mapped and passed
+    in as ``arrays`` instead of being rebuilt.
+    """
+
+    def __init__(self, df: pd.DataFrame, arrays: dict = None):
+        self.df = df
+        if arrays is None:
+            arrays = _build_index_arrays(df)
+        elif len(arrays["doc_len"]) != len(df):
+            raise ValueError("Saved ICD-10 index does not match the code set")
+        self.arrays = arrays
+
+        self.text = PackedStrings(arrays["text_data"], arrays["text_offsets"])
+        self.vocab = PackedStrings(arrays["vocab_data"], arrays["vocab_offsets"])
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+        self.tf = arrays["tf"]
+        self.doc_len = arrays["doc_len"]
+        self.avg_doc_len = float(self.doc_len.mean()) if len(df) else 1.0
+        self.idf = arrays["idf"]
+        self.codes = arrays["codes"]
+        self.code_rows = arrays["code_rows"]
+        self.category = arrays["category"]
+        self.category_size = arrays["category_size"]
+        self._trigrams = None
+        self._code_lookup = None
+
+        # NF-exclusion partitions: a mask for intersecting inside searches
+        # and ready-made row id arrays for whole-scope listings
+        self.nf_col = _nf_column(df)
+        if self.nf_col is not None:
+            self.excluded = df[self.nf_col].notna().to_numpy()
+        else:
+            self.excluded = np.zeros(len(df), dtype=bool)
+        self.scope_rows = {
+            "All": np.arange(len(df), dtype=np.int32),
+            "Included": np.flatnonzero(~self.excluded).astype(np.int32),
+            "Excluded": np.flatnonzero(self.excluded).astype(np.int32),
+        }
+        self._scope_masks = {"Included": ~self.excluded, "Excluded": self.excluded}
+
+        # Per index, so a dropped index (e.g. an evicted release) is freed
+        self.token_rows = lru_cache(maxsize=1024)(self._token_rows)
+
+    def __len__(self):
+        return len(self.df)
+
+    def scope_mask(self, scope: str):
+        """Boolean row mask for the Included/Excluded scope, or None for All."""
+        if self.nf_col is None:
+            return None
+        return self._scope_masks.get(scope)
+
+    def scope_counts(self) -> dict:
+        """Number of codes in each scope, e.g. for a caption."""
+        return {scope: len(rows) for scope, rows in self.scope_rows.items()}
+
+    def _token_rows(self, token: str) -> np.ndarray:
+        """Rows containing any vocabulary token starting with ``token``.
+
+        Called through ``self.token_rows``, which caches recent tokens.
+        """
+        lo, hi = self._vocab_range(token)
+        if lo == hi:
+            return np.empty(0, dtype=np.int32)
+        rows = self.postings[self.offsets[lo]:self.offsets[hi]]
+        return rows if hi - lo == 1 else np.unique(rows)
+
+    def _code_range(self, prefix: str):
+        prefix = normalize_icd10_code(prefix)
+        lo, hi = np.searchsorted(self.codes, [prefix, prefix + "\uffff"])
+        return int(lo), int(hi)
+
+    def code_prefix(self, prefix: str) -> np.ndarray:
+        """Row ids of codes starting with ``prefix`` (dotted or not), in code order."""
+        lo, hi = self._code_range(prefix)
+        return self.code_rows[lo:hi]
+
+    def code_positions(self, codes: pd.Series) -> np.ndarray:
+        """Row id of each normalized code in ``codes``, or -1 if not in the file."""
+        if self._code_lookup is None:
+            # Hash table over the codes, built on first validation
+            self._code_lookup = pd.Index(self.codes).drop_duplicates()
+        pos = self._code_lookup.get_indexer(codes)
+        return np.where(pos >= 0, self.code_rows[np.maximum(pos, 0)], -1)
+
+    def code_children(self, prefix: str = "") -> pd.DataFrame:
+        """Next level of the code hierarchy under ``prefix``.
+
+        The root level lists 3-character categories; below that each
+        level adds one character. Only the codes under ``prefix`` are
+        touched, so browsing stays cheap at any depth.
+        """
+        prefix = normalize_icd10_code(prefix)
+        lo, hi = self._code_range(prefix)
+        depth = max(len(prefix) + 1, CATEGORY_LENGTH)
+
+        codes = self.codes[lo:hi]
+        codes = codes[np.char.str_len(codes) >= depth]
+        nodes, first, counts = np.unique(
+            codes.astype(f"<U{depth}"), return_index=True, return_counts=True
+        )
 
-    mask = (
-        df[code_col].astype(str).str.lower().str.contains(q)
-        | df[short_col].astype(str).str.lower().str.contains(q)
-        | df[long_col].astype(str).str.lower().str.contains(q)
+        # A node is billable when it is itself a code in the file
+        exact = np.searchsorted(self.codes, nodes)
+        exact = np.minimum(exact, len(self.codes) - 1)
+        billable = self.codes[exact] == nodes
+
+        _, short_col, _ = _icd10_columns(self.df)
+        short = self.df[short_col].iloc[self.code_rows[exact]].to_numpy(dtype=object)
+        desc = np.where(billable, short, None)
+
+        return pd.DataFrame({
+            "CODE": nodes,
+            "DISPLAY": [format_icd10_code(c) for c in nodes],
+            "DESCRIPTION": desc,
+            "BILLABLE": billable,
+            "CODES": counts,
+        })
+
+    def match(self, query: str, within: np.ndarray = None) -> np.ndarray:
+        """Sorted row ids matching every token of ``query``.
+
+        ``within`` restricts the search to a sorted set of candidate rows
+        (e.g. the previous search-as-you-type result), which are checked
+        against the normalized row text instead of the postings.
+        """
+        tokens = _tokenize(query)
+        if not tokens:
+            # Punctuation only: nothing the index (or a clinician) can match
+            return np.empty(0, dtype=np.int32)
+
+        if within is not None:
+            needles = [" " + t for t in set(tokens)]
+            text = self.text
+            return np.fromiter(
+                (r for r in within if all(n in text[r] for n in needles)),
+                dtype=np.int32,
+            )
+
+        # Intersect rarest first so the working set shrinks quickly
+        lists = sorted((self.token_rows(t) for t in set(tokens)), key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def _vocab_range(self, token: str):
+        lo = bisect.bisect_left(self.vocab, token)
+        hi = bisect.bisect_left(self.vocab, token + "\uffff", lo)
+        return lo, hi
+
+    def fuzzy_tokens(self, token: str):
+        """Vocabulary ids within a small edit distance of ``token``.
+
+        Candidates are vocabulary tokens sharing a trigram with ``token``,
+        then verified with a bounded Levenshtein distance (1 edit for short
+        words, 2 for words of 8+ characters).
+        """
+        if len(token) < 4:
+            return []
+        if self._trigrams is None:
+            grams = {}
+            for i, word in enumerate(self.vocab):
+                for g in _trigrams(word):
+                    grams.setdefault(g, []).append(i)
+            self._trigrams = grams
+
+        max_edits = 2 if len(token) >= 8 else 1
+        seen = set()
+        for g in _trigrams(token):
+            seen.update(self._trigrams.get(g, ()))
+        lengths = np.diff(self.vocab.offsets)
+        return [
+            (i, d)
+            for i in seen
+            if abs(int(lengths[i]) - len(token)) <= max_edits
+            and (d := _edit_distance(token, self.vocab[i], max_edits)) <= max_edits
+        ]
+
+    def _bm25(self, vocab_id: int) -> tuple:
+        start, end = self.offsets[vocab_id], self.offsets[vocab_id + 1]
+        rows = self.postings[start:end]
+        tf = self.tf[start:end]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[rows] / self.avg_doc_len)
+        return rows, self.idf[vocab_id] * tf * (BM25_K1 + 1) / (tf + norm)
+
+    def _token_scores(self, token: str) -> np.ndarray:
+        """Best BM25 score per row for one query token (exact > prefix > fuzzy)."""
+        scores = np.zeros(len(self.df), dtype=np.float32)
+        lo, hi = self._vocab_range(token)
+        # The vocabulary is sorted, so an exact match is the first in range
+        exact = lo if lo < hi and self.vocab[lo] == token else -1
+        matches = [(i, 1.0 if i == exact else PREFIX_MATCH_WEIGHT) for i in range(lo, hi)]
+        if not matches:
+            matches = [
+                (i, FUZZY_MATCH_WEIGHT / d) for i, d in self.fuzzy_tokens(token)
+            ]
+        if matches:
+            parts = [self._bm25(vocab_id) for vocab_id, _ in matches]
+            rows = np.concatenate([r for r, _ in parts])
+            contrib = np.concatenate([c * w for (_, c), (_, w) in zip(parts, matches)])
+            np.maximum.at(scores, rows, contrib)
+            # Favour categories that are about this token over rows where
+            # it is one qualifier among many
+            hit = np.flatnonzero(scores > 0)
+            cats = self.category[hit]
+            focus = np.bincount(cats, minlength=len(self.category_size)) / self.category_size
+            scores[hit] *= (1 - CATEGORY_FOCUS_WEIGHT) + CATEGORY_FOCUS_WEIGHT * focus[cats]
+        return scores
+
+    def rank(self, query: str, k: int = 50, allowed: np.ndarray = None):
+        """Top ``k`` rows for ``query`` as (row_ids, scores), best first.
+
+        Exact code matches rank first, then code-prefix matches, then rows
+        scored by BM25 over the code/short/long tokens, weighted towards
+        categories the words are about. Rows matching more
+        of the query's words are favoured over partial matches. ``allowed`` is an
+        optional boolean mask restricting which rows may be returned.
+        """
+        n = len(self.df)
+        scores = np.zeros(n, dtype=np.float32)
+
+        q = query.strip().upper()
+        code_hit = False
+        if CODE_QUERY_RE.match(q):
+            lo, hi = self._code_range(q)
+            extra = np.char.str_len(self.codes[lo:hi]) - len(normalize_icd10_code(q))
+            # Shorter (less specific) codes first within the prefix
+            scores[self.code_rows[lo:hi]] = np.where(extra == 0, 1000.0, 100.0 - extra)
+            code_hit = hi > lo
+
+        tokens = list(dict.fromkeys(_tokenize(query)))
+        if tokens and not code_hit:
+            text_scores = np.zeros(n, dtype=np.float32)
+            matched = np.zeros(n, dtype=np.float32)
+            for token in tokens:
+                token_scores = self._token_scores(token)
+                text_scores += token_scores
+                matched += token_scores > 0
+            scores += text_scores * (matched / len(tokens))
+
+        if allowed is not None:
+            scores[~allowed] = 0
+        hits = np.flatnonzero(scores > 0) if k > 0 else np.empty(0, dtype=np.int64)
+        if len(hits) > k:
+            # O(matches) selection of the k-th best score; ties at the cut
+            # are resolved in file order
+            hit_scores = scores[hits]
+            cut = -np.partition(-hit_scores, k - 1)[k - 1]
+            above = hits[hit_scores > cut]
+            hits = np.concatenate([above, hits[hit_scores == cut][:k - len(above)]])
+        # Best score first; ties keep file order
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return hits.astype(np.int32), scores[hits]
+
+
+def _trigrams(word: str):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) past ``limit``."""
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+@lru_cache(maxsize=1)
+def service_client():
+    """Client for the shared lookup service (icd10_service.py), or None.
+
+    Set ICD10_SERVICE_URL (e.g. http://127.0.0.1:8765 or
+    unix:///tmp/icd10.sock) to have searches, prefix lookups and
+    validation answered by the service instead of a local index.
+    """
+    url = os.environ.get("ICD10_SERVICE_URL")
+    if not url:
+        return None
+    return _service_client_for(url)
+
+
+@lru_cache(maxsize=None)
+def _service_client_for(url: str):
+    # One client per process, so its connection pool is reused by every
+    # session and rerun
+    from icd10_service import ICD10ServiceClient
+    return ICD10ServiceClient(url)
+
+
+@lru_cache(maxsize=1)
+@timed("icd10_index_build")
+def get_icd10_index() -> ICD10Index:
+    """Search index over ``load_icd10()``, built once per process.
+
+    With ICD10_SHARED_TABLE=1 the index arrays are memory-mapped from the
+    shared folder instead, so workers on one host share them too.
+    """
+    df = load_icd10()
+    if SHARED_TABLE:
+        try:
+            return ICD10Index(df, map_icd10_shared_index(build_icd10_shared_index(ICD_PATH)))
+        except (ImportError, OSError, ValueError):
+            pass
+    return ICD10Index(df)
+
+
+@lru_cache(maxsize=RELEASE_INDEX_CACHE_SIZE)
+@timed("icd10_index_build")
+def get_release_index(release: str) -> ICD10Index:
+    """Search index over another registered CMS release (see ``icd10_releases``).
+
+    The index holds its own frame of the release, assembled from the row
+    pool, until it is evicted from this cache.
+    """
+    from icd10_releases import get_release_registry
+    return ICD10Index(get_release_registry().frame(release))
+
+
+def _release_index(release: str = None, as_of=None):
+    """Index for ``release`` or the release in force on ``as_of``.
+
+    None means the current release (``ICD_PATH``), which callers serve as
+    before: from ``get_icd10_index()`` or the lookup service.
+    """
+    if release is None and as_of is None:
+        return None
+    from icd10_releases import get_release_registry
+    registry = get_release_registry()
+    name = registry.resolve(release, as_of)
+    return None if name == registry.current else get_release_index(name)
+
+
+def _search_rows(index: ICD10Index, query: str, scope: str, ranked: bool, k: int, within=None):
+    """Row ids for a search, plus whether they came from the token matcher."""
+    with stage_timer("icd10_search"):
+        rows, from_tokens = _match_rows(index, query, scope, ranked, k, within)
+    record_rows("icd10_search", len(rows))
+    return rows, from_tokens
+
+
+def _match_rows(index: ICD10Index, query: str, scope: str, ranked: bool, k: int, within):
+    allowed = index.scope_mask(scope)
+
+    if not query.strip():
+        rows = index.scope_rows["All" if allowed is None else scope]
+        # Ranked results are "at most k", even with nothing to rank by
+        return (rows[:k] if ranked else rows), False
+
+    if ranked:
+        return index.rank(query, k=k, allowed=allowed)[0], False
+
+    rows, from_tokens = None, False
+    if CODE_QUERY_RE.match(query.strip().upper()):
+        rows = np.sort(index.code_prefix(query))
+    if rows is None or not len(rows):
+        rows = index.match(query, within=within)
+        # A query with no tokens (e.g. ".") matches nothing, but longer
+        # queries typed after it can match, so it cannot be refined
+        from_tokens = bool(_tokenize(query))
+
+    if allowed is not None:
+        rows = rows[allowed[rows]]
+    return rows, from_tokens
+
+
+class ICD10Results:
+    """Lazy search result: holds matching row ids, builds rows on demand.
+
+    Only ``page()`` and iteration touch the DataFrame, so a 74k-row match
+    costs an int array until something is actually displayed.
+    """
+
+    def __init__(self, index: ICD10Index, rows: np.ndarray):
+        self.index = index
+        self.rows = rows
+
+    @property
+    def total(self) -> int:
+        return len(self.rows)
+
+    def __len__(self):
+        return self.total
+
+    def page(self, offset: int = 0, limit: int = 50) -> pd.DataFrame:
+        """Rows ``offset`` .. ``offset + limit`` of the result."""
+        offset = max(offset, 0)
+        return self.index.df.iloc[self.rows[offset:offset + max(limit, 0)]]
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, chunk_size: int = 1000):
+        """Yield matching rows as dicts, materializing one chunk at a time."""
+        for offset in range(0, self.total, chunk_size):
+            yield from self.page(offset, chunk_size).to_dict("records")
+
+
+def query_icd10(query: str = "", scope: str = "All", ranked: bool = False, k: int = 50,
+                release: str = None, as_of=None) -> ICD10Results:
+    """Like ``search_icd10`` but returns a lazy, pageable ``ICD10Results``."""
+    index = _release_index(release, as_of)
+    if index is None:
+        client = service_client()
+        if client is not None:
+            return client.query(query, scope, ranked, k)
+        index = get_icd10_index()
+    rows, _ = _search_rows(index, query, scope, ranked, k)
+    return ICD10Results(index, rows)
+
+
+def search_icd10(query: str = "", scope: str = "All", ranked: bool = False, k: int = 50,
+                 release: str = None, as_of=None):
+    """Search ICD-10 codes by code or text. Scope can be All/Included/Excluded.
+
+    With ``ranked=True`` the best ``k`` matches are returned in relevance
+    order (typo tolerant); otherwise every match is returned in file order.
+    ``release`` (e.g. "2025-10") or ``as_of`` (a date) searches another
+    registered CMS release instead of the current one.
+    """
+    index = _release_index(release, as_of)
+    if index is None:
+        client = service_client()
+        if client is not None:
+            return client.search(query, scope, ranked, k)
+        index = get_icd10_index()
+    rows, _ = _search_rows(index, query, scope, ranked, k)
+    return index.df.iloc[rows]
+
+
+def icd10_scope_counts() -> dict:
+    """Code counts for All / Included / Excluded, precomputed at load."""
+    client = service_client()
+    if client is not None:
+        return client.scope_counts()
+    return get_icd10_index().scope_counts()
+
+
+class ICD10SearchSession:
+    """Search-as-you-type state for one user.
+
+    Keeps a small LRU of recent query -> row ids, so backspacing is a
+    cache hit, and when a new query extends an earlier one ("diab" ->
+    "diabe") only that earlier result is re-checked instead of the
+    whole table. Keep one per user, e.g. in ``st.session_state``.
+
+    When the lookup service is configured and no ``index`` is given,
+    queries go to the service, which keeps its own shared LRU.
+    """
+
+    def __init__(self, max_entries: int = 32, index: ICD10Index = None):
+        self.max_entries = max_entries
+        self._index = index
+        # (query, scope, ranked, k) -> (rows, refinable)
+        self._recent = OrderedDict()
+        # The lookup service shares one session across its worker threads
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> ICD10Index:
+        if self._index is None:
+            self._index = get_icd10_index()
+        return self._index
+
+    def rows(self, query: str = "", scope: str = "All", ranked: bool = False, k: int = 50) -> np.ndarray:
+        key = (query.strip().lower(), scope, ranked, k if ranked else None)
+        with self._lock:
+            hit = self._recent.get(key)
+            if hit is not None:
+                self._recent.move_to_end(key)
+            else:
+                within = self._candidates(key)
+        record_cache("icd10_session", hit is not None)
+        if hit is not None:
+            return hit[0]
+
+        rows, refinable = _search_rows(self.index, query, scope, ranked, k, within=within)
+        with self._lock:
+            self._recent[key] = (rows, refinable)
+            if len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+        return rows
+
+    def _candidates(self, key):
+        """Smallest cached token-match result whose query the new one extends."""
+        query, scope, ranked, _ = key
+        if ranked:
+            return None
+        best = None
+        for (q, s, r, _), (rows, refinable) in self._recent.items():
+            if refinable and s == scope and not r and q and query.startswith(q):
+                if best is None or len(rows) < len(best):
+                    best = rows
+        # Past a few thousand rows the postings intersection is quicker
+        # than re-checking candidates one by one
+        return best if best is not None and len(best) <= REFINE_MAX_ROWS else None
+
+    def query(self, query: str = "", scope: str = "All", ranked: bool = False, k: int = 50) -> ICD10Results:
+        """Same as ``query_icd10`` but reusing this session's recent results."""
+        if self._index is None and service_client() is not None:
+            return query_icd10(query, scope, ranked, k)
+        return ICD10Results(self.index, self.rows(query, scope, ranked, k))
+
+    def search(self, query: str = "", scope: str = "All", ranked: bool = False, k: int = 50):
+        """Same as ``search_icd10`` but reusing this session's recent results."""
+        if self._index is None and service_client() is not None:
+            return search_icd10(query, scope, ranked, k)
+        return self.index.df.iloc[self.rows(query, scope, ranked, k)]
+
+
+@timed("icd10_option_labels")
+def icd10_option_labels(df: pd.DataFrame) -> pd.Series:
+    """Selectbox labels ("CODE – description") for search results."""
+    code_col = "CODE" if "CODE" in df.columns else df.columns[0]
+    desc_col = df.columns[1]
+    return df[code_col].astype(str) + " – " + df[desc_col].astype(str)
+
+
+def lookup_icd10_prefix(prefix: str):
+    """All codes starting with ``prefix``; accepts "S72.0" as well as "S720"."""
+    client = service_client()
+    if client is not None:
+        return client.prefix(prefix)
+    index = get_icd10_index()
+    return index.df.iloc[index.code_prefix(prefix)]
+
+
+def icd10_children(prefix: str = ""):
+    """Child nodes of ``prefix`` in the category -> subcategory -> code tree."""
+    client = service_client()
+    if client is not None:
+        return client.children(prefix)
+    return get_icd10_index().code_children(prefix)
+
+
+@timed("icd10_validate")
+def validate_icd10_codes(codes, index: ICD10Index = None, release: str = None, as_of=None) -> pd.DataFrame:
+    """Check a batch of billing codes against the CMS code set.
+
+    ``codes`` is any list-like of strings; dots, case and surrounding
+    whitespace are ignored. Returns one row per input with the
+    normalized CODE, a STATUS of valid / invalid / nf_excluded, and the
+    short and long descriptions for codes that exist. ``release`` or
+    ``as_of`` (e.g. the encounter date) validates against that release.
+    """
+    if index is None:
+        index = _release_index(release, as_of)
+    if index is None and service_client() is not None:
+        return service_client().validate(codes)
+    index = index or get_icd10_index()
+    _, short_col, long_col = _icd10_columns(index.df)
+
+    inputs = pd.Series(codes, dtype=object).reset_index(drop=True)
+    normalized = (
+        inputs.fillna("").astype(str)
+        .str.strip()
+        .str.upper()
+        .str.replace(".", "", regex=False)
+        .str.replace(" ", "", regex=False)
+    )
+    rows = index.code_positions(normalized)
+    found = rows >= 0
+    safe_rows = np.maximum(rows, 0)
+
+    status = np.where(
+        ~found, CODE_INVALID, np.where(index.excluded[safe_rows], CODE_NF_EXCLUDED, CODE_VALID)
     )
+    short = index.df[short_col].iloc[safe_rows].to_numpy(dtype=object)
+    long_ = index.df[long_col].iloc[safe_rows].to_numpy(dtype=object)
+
+    return pd.DataFrame({
+        "INPUT": inputs,
+        "CODE": normalized,
+        "STATUS": status,
+        short_col: np.where(found, short, None),
+        long_col: np.where(found, long_, None),
+    })
+
+
+def _validate_by_date(codes: pd.Series, dates: pd.Series) -> pd.DataFrame:
+    """Validate each code against the release in force on its date."""
+    from icd10_releases import get_release_registry
+
+    releases = get_release_registry().releases_for_dates(dates)
+    parts = []
+    for name, positions in pd.Series(np.arange(len(codes))).groupby(releases, sort=False):
+        part = validate_icd10_codes(codes.iloc[positions.to_numpy()].reset_index(drop=True), release=name)
+        part.index = positions.to_numpy()
+        parts.append(part.assign(RELEASE=name))
+    return pd.concat(parts).sort_index()
+
+
+def validate_icd10_csv(path: str, out, column=None, header: bool = True, chunksize: int = 200_000,
+                       release: str = None, as_of=None, date_column=None) -> dict:
+    """Validate a CSV of codes in chunks, writing results to ``out``.
+
+    Memory stays bounded by ``chunksize`` regardless of file length.
+    Returns the number of codes per status. With ``date_column`` (e.g.
+    the claim's service date) each code is checked against the release in
+    force on its date and the output gains a RELEASE column; otherwise
+    ``release`` / ``as_of`` pick one release for the whole file.
+    """
+    totals = {CODE_VALID: 0, CODE_INVALID: 0, CODE_NF_EXCLUDED: 0}
+    usecols = None
+    if column is not None:
+        usecols = [column] if date_column is None else [column, date_column]
+    elif date_column is not None:
+        raise ValueError("date_column needs column to name the code column")
+    reader = pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        header=0 if header else None,
+        usecols=usecols,
+        chunksize=chunksize,
+    )
+    for i, chunk in enumerate(reader):
+        if date_column is not None:
+            result = _validate_by_date(chunk[column], chunk[date_column])
+        else:
+            codes = chunk.iloc[:, 0] if column is None else chunk[column]
+            result = validate_icd10_codes(codes, release=release, as_of=as_of)
+        result.to_csv(out, index=False, header=(i == 0))
+        for status, n in result["STATUS"].value_counts().items():
+            totals[status] += int(n)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ICD-10 dataset utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_cache = sub.add_parser("build-cache", help="Compile the CMS workbook into the Parquet cache")
+    p_cache.add_argument("path", nargs="?", default=ICD_PATH)
+    p_cache.add_argument("--force", action="store_true", help="Rebuild even if the cache is current")
+    p_cache.add_argument("--shared", action="store_true", help="Also build the memory-mappable table and index")
+
+    p_validate = sub.add_parser("validate", help="Validate a CSV of ICD-10 codes")
+    p_validate.add_argument("path", help="CSV file, or - for stdin")
+    p_validate.add_argument("-o", "--output", default="-", help="Output CSV (default: stdout)")
+    p_validate.add_argument("--column", help="Column holding the codes (default: first)")
+    p_validate.add_argument("--no-header", action="store_true", help="Input has no header row")
+    p_validate.add_argument("--chunksize", type=int, default=200_000)
+    p_validate.add_argument("--release", help="Validate against this CMS release (see icd10_releases.py list)")
+    p_validate.add_argument("--as-of", help="Validate against the release in force on this date (YYYY-MM-DD)")
+    p_validate.add_argument("--date-column", help="Per-row date column; each code uses the release in force then")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build-cache":
+        print(build_icd10_cache(args.path, force=args.force))
+        if args.shared:
+            print(build_icd10_shared_table(args.path, force=args.force))
+            print(build_icd10_shared_index(args.path, force=args.force))
+    elif args.command == "validate":
+        if args.date_column is not None and args.column is None:
+            parser.error("--date-column requires --column")
+        source = sys.stdin if args.path == "-" else args.path
+        column, date_column = args.column, args.date_column
+        if args.no_header:
+            column = int(column) if column is not None else None
+            date_column = int(date_column) if date_column is not None else None
+        options = dict(release=args.release, as_of=args.as_of, date_column=date_column)
+        if args.output == "-":
+            totals = validate_icd10_csv(source, sys.stdout, column, not args.no_header, args.chunksize, **options)
+        else:
+            with open(args.output, "w", newline="") as out:
+                totals = validate_icd10_csv(source, out, column, not args.no_header, args.chunksize, **options)
+        print(", ".join(f"{status}: {n:,}" for status, n in totals.items()), file=sys.stderr)
+        return 1 if totals[CODE_INVALID] else 0
+    return 0
+
 
-    return df[mask]
+if __name__ == "__main__":
+    sys.exit(main())
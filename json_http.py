@@ -0,0 +1,95 @@
+"""Minimal HTTP/1.1 JSON server loop for the local asyncio services.
+
+``icd10_service.py`` and ``mock_completion_server.py`` both answer small
+JSON requests over keep-alive connections. ``serve_connection`` reads each
+request, passes it to the service's ``dispatch`` coroutine and writes the
+JSON reply, so the two servers share one request/response loop.
+"""
+import json
+import asyncio
+from http import HTTPStatus
+
+
+def error_payload(status: int, message: str) -> dict:
+    return {"error": message}
+
+
+def _reason(status: int) -> str:
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """(method, target, headers, body) for the next request, or None at EOF."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length") or 0))
+    return method, target, headers, body
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: int, payload, extra_headers: dict = None):
+    data = json.dumps(payload).encode()
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (extra_headers or {}).items())
+    writer.write(
+        f"HTTP/1.1 {status} {_reason(status)}\r\n"
+        "Content-Type: application/json\r\n"
+        f"{extra}Content-Length: {len(data)}\r\n\r\n".encode("latin-1")
+        + data
+    )
+    await writer.drain()
+
+
+async def serve_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    dispatch,
+    error=error_payload,
+    status_headers: dict = None,
+):
+    """Serve HTTP/1.1 requests on one keep-alive connection.
+
+    ``dispatch(method, target, body)`` is a coroutine returning
+    ``(status, payload)``. ``ValueError``/``KeyError`` from it become 400
+    responses and anything else a 500, with the body built by
+    ``error(status, message)``. A request that cannot be parsed gets a 400
+    and the connection is closed. ``status_headers`` maps a status code to
+    extra response headers, e.g. ``{429: {"Retry-After": "1"}}``.
+    """
+    status_headers = status_headers or {}
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except ValueError as exc:
+                await _write_response(writer, 400, error(400, f"malformed request: {exc}"))
+                break
+            if request is None:
+                break
+            method, target, headers, body = request
+
+            try:
+                status, payload = await dispatch(method, target, body)
+            except (ValueError, KeyError) as exc:
+                status, payload = 400, error(400, str(exc))
+            except Exception as exc:
+                status, payload = 500, error(500, repr(exc))
+
+            await _write_response(writer, status, payload, status_headers.get(status))
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
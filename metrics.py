@@ -0,0 +1,285 @@
+"""Lightweight timing and cache metrics for the Streamlit apps.
+
+Set ``EHR_METRICS=1`` to record:
+
+- per-stage latency histograms (``stage_timer("icd10_search")`` or
+  ``@timed("icd10_load")``),
+- row counts per stage (``record_rows``),
+- cache hits and misses (``record_cache``).
+
+Everything is per process. When metrics are off (the default), ``timed``
+returns the function unchanged and the other helpers return after one
+flag check, so instrumented code pays close to nothing.
+
+The numbers are exported in Prometheus text format by ``prometheus_text()``,
+served on ``EHR_METRICS_HOST``:``EHR_METRICS_PORT`` when a port is set, and
+shown in an admin sidebar panel (``metrics_sidebar()``) when the process runs
+with ``EHR_METRICS_ADMIN=1``.
+"""
+import os
+import time
+import bisect
+import threading
+from functools import lru_cache, wraps
+
+ENABLED = os.environ.get("EHR_METRICS") == "1"
+EXPORT_PORT = os.environ.get("EHR_METRICS_PORT")
+# Loopback only unless a scraper on another host needs it (e.g. 0.0.0.0)
+EXPORT_HOST = os.environ.get("EHR_METRICS_HOST", "127.0.0.1")
+# The sidebar panel can reset the counters, so it is opt-in per deployment
+ADMIN = os.environ.get("EHR_METRICS_ADMIN") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+class Histogram:
+    """Fixed-bucket histogram, Prometheus style (upper bounds, plus +Inf)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+_lock = threading.Lock()
+_latency = {}  # stage -> Histogram of seconds
+_rows = {}  # stage -> Histogram of row counts
+_cache = {}  # (cache, "hit" | "miss") -> count
+
+
+def observe(stage: str, seconds: float):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _latency.get(stage)
+        if hist is None:
+            hist = _latency[stage] = Histogram(LATENCY_BUCKETS)
+        hist.observe(seconds)
+
+
+def record_rows(stage: str, rows: int):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _rows.get(stage)
+        if hist is None:
+            hist = _rows[stage] = Histogram(ROW_BUCKETS)
+        hist.observe(rows)
+
+
+def record_cache(cache: str, hit: bool):
+    if not ENABLED:
+        return
+    key = (cache, "hit" if hit else "miss")
+    with _lock:
+        _cache[key] = _cache.get(key, 0) + 1
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def stage_timer(stage: str):
+    """Context manager timing a block as ``stage``."""
+    return _StageTimer(stage) if ENABLED else _NO_TIMER
+
+
+def timed(stage: str):
+    """Decorator timing every call as ``stage``; a no-op when metrics are off."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def reset():
+    with _lock:
+        _latency.clear()
+        _rows.clear()
+        _cache.clear()
+
+
+def _histogram_lines(name: str, label: str, hist: Histogram) -> list:
+    lines = []
+    cumulative = 0
+    for bound, n in zip(hist.buckets, hist.counts):
+        cumulative += n
+        lines.append(f'{name}_bucket{{stage="{label}",le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{stage="{label}",le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{stage="{label}"}} {hist.sum:.6f}')
+    lines.append(f'{name}_count{{stage="{label}"}} {hist.count}')
+    return lines
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        latency = sorted(_latency.items())
+        rows = sorted(_rows.items())
+        cache = sorted(_cache.items())
+
+    lines = [
+        "# HELP ehr_stage_seconds Time spent per app stage.",
+        "# TYPE ehr_stage_seconds histogram",
+    ]
+    for stage, hist in latency:
+        lines += _histogram_lines("ehr_stage_seconds", stage, hist)
+    lines += [
+        "# HELP ehr_stage_rows Rows produced per app stage.",
+        "# TYPE ehr_stage_rows histogram",
+    ]
+    for stage, hist in rows:
+        lines += _histogram_lines("ehr_stage_rows", stage, hist)
+    lines += [
+        "# HELP ehr_cache_requests_total Cache lookups by result.",
+        "# TYPE ehr_cache_requests_total counter",
+    ]
+    for (name, result), n in cache:
+        lines.append(f'ehr_cache_requests_total{{cache="{name}",result="{result}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def stage_summary():
+    """Per-stage latency and row statistics as a DataFrame."""
+    import pandas as pd
+
+    with _lock:
+        latency = {stage: (h.count, h.sum, h.quantile(0.5), h.quantile(0.99)) for stage, h in _latency.items()}
+        rows = {stage: h.sum / h.count for stage, h in _rows.items() if h.count}
+    records = [
+        {
+            "stage": stage,
+            "calls": count,
+            "mean_ms": round(total / count * 1000, 2) if count else 0.0,
+            "p50_ms ≤": p50 * 1000,
+            "p99_ms ≤": p99 * 1000,
+            "mean_rows": round(rows[stage], 1) if stage in rows else None,
+        }
+        for stage, (count, total, p50, p99) in sorted(latency.items())
+    ]
+    return pd.DataFrame(records)
+
+
+def cache_summary():
+    """Hits, misses and hit rate per cache as a DataFrame."""
+    import pandas as pd
+
+    with _lock:
+        cache = dict(_cache)
+    names = sorted({name for name, _ in cache})
+    records = []
+    for name in names:
+        hits, misses = cache.get((name, "hit"), 0), cache.get((name, "miss"), 0)
+        records.append({
+            "cache": name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        })
+    return pd.DataFrame(records)
+
+
+@lru_cache(maxsize=1)
+def start_exporter(port: int = None, host: str = None):
+    """Serve ``/metrics`` on ``host:port`` (default EHR_METRICS_HOST and
+    EHR_METRICS_PORT) in a thread.
+
+    Returns the server, or None when metrics or the port are not
+    configured, or another worker process already holds the port.
+    """
+    port = port or EXPORT_PORT
+    host = host or EXPORT_HOST
+    if not ENABLED or not port:
+        return None
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode()
+            self.send_response(200 if self.path.split("?")[0] in ("/", "/metrics") else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+
+def metrics_sidebar():
+    """Admin metrics panel in the Streamlit sidebar, shown with EHR_METRICS_ADMIN=1."""
+    if not ENABLED:
+        return
+    import streamlit as st
+
+    start_exporter()
+    if not ADMIN:
+        return
+    with st.sidebar.expander("Metrics (admin)", expanded=False):
+        st.caption("Per-process timings since start. Percentiles are histogram bucket bounds.")
+        st.dataframe(stage_summary(), use_container_width=True, hide_index=True)
+        st.dataframe(cache_summary(), use_container_width=True, hide_index=True)
+        st.download_button("Download Prometheus metrics", prometheus_text(), file_name="metrics.prom")
+        if st.button("Reset metrics"):
+            reset()
@@ -0,0 +1,135 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers ``POST /v1/chat/completions`` with a canned ADR explanation after a
+configurable delay, and fails a configurable share of requests with 429 or
+500 responses, so the ADR assistant and ``adr_batch.py`` can be exercised
+and benchmarked without an API key or network access.
+
+    python mock_completion_server.py --port 8911 --latency 0.5 --failure-rate 0.05
+    export OPENAI_BASE_URL=http://127.0.0.1:8911/v1 OPENAI_API_KEY=mock
+
+``GET /stats`` reports how many requests were answered and failed.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from json_http import serve_connection
+
+DEFAULT_PORT = 8911
+
+MOCK_TEXT = (
+    "**Overall ADR risk:** mock response.\n\n"
+    "- Generated by the local mock completion server.\n\n"
+    "_This is NOT medical advice and must not replace clinical judgment._"
+)
+
+
+def _error_payload(status: int, message: str) -> dict:
+    """Error body in the OpenAI API's shape."""
+    return {"error": {"message": message, "type": "mock_error", "code": status}}
+
+
+class MockCompletionServer:
+    """Chat completion handler with simulated latency and failures."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "completed": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    async def complete(self, body: bytes):
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(max(delay, 0.0))
+
+            if self.random.random() < self.failure_rate:
+                self.stats["failed"] += 1
+                status = self.random.choice([429, 500])
+                return status, _error_payload(status, "simulated failure")
+
+            request = json.loads(body or b"{}")
+            prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+            self.stats["completed"] += 1
+            return 200, {
+                "id": f"chatcmpl-mock-{self.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": MOCK_TEXT},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(MOCK_TEXT) // 4,
+                    "total_tokens": (prompt_chars + len(MOCK_TEXT)) // 4,
+                },
+            }
+        finally:
+            self.stats["in_flight"] -= 1
+
+    async def dispatch(self, method: str, path: str, body: bytes):
+        path = path.split("?", 1)[0]
+        if method == "POST" and path.endswith("/chat/completions"):
+            return await self.complete(body)
+        if method == "GET" and path == "/stats":
+            return 200, self.stats
+        return 404, _error_payload(404, f"no route for {method} {path}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one keep-alive connection."""
+        await serve_connection(
+            reader,
+            writer,
+            self.dispatch,
+            error=_error_payload,
+            status_headers={429: {"Retry-After": "1"}},
+        )
+
+
+async def serve(host: str = "127.0.0.1", port: int = DEFAULT_PORT, **options):
+    mock = MockCompletionServer(**options)
+    server = await asyncio.start_server(mock.handle, host, port, backlog=1024)
+    print(f"Mock completion server on http://{host}:{port}/v1", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 429/500")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(
+            args.host,
+            args.port,
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            seed=args.seed,
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Fast startup for the EHR app.
+
+``ehr_app.py`` imports only light modules at the top and pulls in the
+ICD-10 code (and with it pandas, numpy and pyarrow) when a panel first
+needs it. ``start_warmup()`` is called on the first page run of each
+server process. It loads the code set and builds the search index on a
+background thread, so the first search does not wait for the Excel or
+Parquet load. The UI checks ``icd10_ready()`` and, if a search arrives
+early, waits with ``wait_for_icd10()`` rather than loading a second copy.
+
+Set ``EHR_WARMUP=0`` to turn the warm-up off; the first search then loads
+the data itself, as before.
+
+    python startup.py profile                 # import times and time to first search
+    python startup.py profile --query "E11" --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from functools import lru_cache
+
+from metrics import observe
+
+WARMUP = os.environ.get("EHR_WARMUP", "1") != "0"
+
+# Modules timed by ``profile``: each one is imported by a bare
+# ``python -X importtime -c "import X"``, so its time includes everything
+# it pulls in and nothing the profiler itself has already imported
+PROFILE_MODULES = [
+    "metrics", "startup", "adr_utils", "encounter_store",
+    "streamlit", "numpy", "pandas", "pyarrow", "openai", "icd10_utils",
+]
+
+_ready = threading.Event()
+_status = {"state": "idle", "seconds": None, "error": None}
+
+
+def _warm_icd10():
+    start = time.perf_counter()
+    _status["state"] = "loading"
+    try:
+        import icd10_utils
+
+        # With the lookup service configured there is nothing to load here
+        if icd10_utils.service_client() is None:
+            index = icd10_utils.get_icd10_index()
+            # Typo-tolerant matching builds its trigram table on first use
+            index.fuzzy_tokens("warmup")
+        _status["state"] = "ready"
+    except Exception as exc:
+        # The first search loads the data again and shows the error there
+        _status.update(state="failed", error=f"{type(exc).__name__}: {exc}")
+    finally:
+        _status["seconds"] = round(time.perf_counter() - start, 3)
+        observe("icd10_warmup", _status["seconds"])
+        _ready.set()
+
+
+@lru_cache(maxsize=1)
+def start_warmup():
+    """Start the ICD-10 warm-up thread once per process; None if disabled."""
+    if not WARMUP:
+        return None
+    thread = threading.Thread(target=_warm_icd10, name="icd10-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def icd10_ready() -> bool:
+    """True once the warm-up has finished (or failed)."""
+    return _ready.is_set()
+
+
+def wait_for_icd10(timeout: float = None) -> bool:
+    """Block until the warm-up finishes; returns ``icd10_ready()``.
+
+    Returns straight away when no warm-up is running, so callers fall
+    through to loading the data themselves.
+    """
+    if start_warmup() is None:
+        return icd10_ready()
+    return _ready.wait(timeout)
+
+
+def warmup_status() -> dict:
+    """Warm-up state (idle / loading / ready / failed), duration and error."""
+    return dict(_status)
+
+
+# ---------------------------------------------------------
+# PROFILING
+# ---------------------------------------------------------
+def _measure_import(module: str) -> dict:
+    """Cumulative import time of ``module`` in a clean interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_worker_env(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | name", with
+    # nested imports indented under the module that pulled them in
+    lines = proc.stderr.splitlines()
+    if proc.returncode != 0:
+        stderr = "\n".join(line for line in lines if not line.startswith("import time:"))
+        return {"module": module, "error": f"exit code {proc.returncode}", "stderr": stderr[-2000:]}
+    for line in reversed(lines):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2] == f" {module}":
+            return {"module": module, "import_ms": round(int(fields[1]) / 1000, 1)}
+    return {"module": module, "error": "no import time reported"}
+
+
+def _measure_first_search(query: str, warm: bool) -> dict:
+    """Time to first search from process start, with or without warm-up.
+
+    Cold: the search itself imports, loads and indexes. Warm: the warm-up
+    runs first (as it does while the page renders) and only the search
+    after it is timed.
+    """
+    result = {}
+    start = time.perf_counter()
+    if warm:
+        start_warmup()
+        wait_for_icd10()
+        result["warmup_s"] = round(time.perf_counter() - start, 3)
+        result["warmup_state"] = warmup_status()["state"]
+    t0 = time.perf_counter()
+    import icd10_utils
+
+    icd10_utils.search_icd10(query, ranked=True, k=50)
+    result["first_search_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    result["time_to_first_search_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _worker_env() -> dict:
+    # The app's modules import from this directory wherever we run from
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, env.get("PYTHONPATH")]))
+    return env
+
+
+def _run_worker(args: list) -> dict:
+    """Run this script in worker mode in a fresh process; return its JSON."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *args],
+        env=_worker_env(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": f"exit code {proc.returncode}", "stderr": proc.stderr[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def profile(query: str = "diabetes") -> dict:
+    """Import times per module and time to first search, cold and warmed."""
+    imports = [_measure_import(module) for module in PROFILE_MODULES]
+    return {
+        "imports": imports,
+        "first_search_cold": _run_worker(["--search", query]),
+        "first_search_warm": _run_worker(["--search", query, "--warm"]),
+    }
+
+
+def _print_report(report: dict):
+    print("Import time (clean interpreter, including dependencies)")
+    for row in report["imports"]:
+        value = f"{row['import_ms']:>9.1f} ms" if "import_ms" in row else f"  {row.get('error')}"
+        print(f"  {row.get('module', '?'):18s}{value}")
+    for name, label in (("first_search_cold", "without warm-up"), ("first_search_warm", "after warm-up")):
+        row = report[name]
+        print(f"First search {label}")
+        if "error" in row:
+            print(f"  {row['error']}\n{row.get('stderr', '')}")
+            continue
+        if "warmup_s" in row:
+            print(f"  warm-up             {row['warmup_s']:>9.3f} s ({row['warmup_state']})")
+        print(f"  search              {row['first_search_ms']:>9.1f} ms")
+        print(f"  from process start  {row['time_to_first_search_s']:>9.3f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EHR app startup helpers")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("profile", help="Report import times and time to first ICD-10 search")
+    p.add_argument("--query", default="diabetes", help="Search to time (default: %(default)s)")
+    p.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--search", help=argparse.SUPPRESS)
+    parser.add_argument("--warm", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.search is not None:
+        print(json.dumps(_measure_first_search(args.search, args.warm)))
+        return 0
+    if args.command != "profile":
+        parser.print_help()
+        return 2
+
+    report = profile(args.query)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""adr_batch against the local mock completion server."""
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("openai")
+from openai import AsyncOpenAI
+
+import adr_batch
+from adr_utils import ResponseCache
+from mock_completion_server import MockCompletionServer
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    # Every run must reach the server, not answers cached by an earlier one
+    monkeypatch.setattr(adr_batch, "response_cache", ResponseCache(disk_dir=None))
+
+
+@pytest.fixture
+def encounters(tmp_path):
+    path = tmp_path / "encounters.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(40):
+            f.write(json.dumps({"id": i, "age": 60 + i % 30, "meds": f"drug{i}\nasa", "bp": "150/95"}) + "\n")
+    return str(path)
+
+
+def run_against_mock(input_path, output_path, mock, **options):
+    async def run():
+        server = await asyncio.start_server(mock.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = AsyncOpenAI(api_key="mock", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0, timeout=10)
+        try:
+            return await adr_batch.run_batch(
+                input_path, output_path, client=client, concurrency=8, backoff=0.001, progress_every=0, **options
+            )
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_transient_failures_are_retried(encounters, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    mock = MockCompletionServer(latency=0.0, failure_rate=0.3, seed=7)
+
+    stats = run_against_mock(encounters, output, mock, max_retries=8)
+
+    assert stats["ok"] == 40 and stats["error"] == 0
+    assert mock.stats["failed"] > 0
+    assert stats["retries"] == mock.stats["failed"]
+    results = read_results(output)
+    assert sorted(r["id"] for r in results) == sorted(str(i) for i in range(40))
+    assert all(r["status"] == adr_batch.STATUS_OK and r["text"] for r in results)
+
+
+def test_failures_are_recorded_then_resumed(encounters, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+
+    failing = MockCompletionServer(latency=0.0, failure_rate=0.5, seed=3)
+    first = run_against_mock(encounters, output, failing, max_retries=1)
+    assert first["error"] > 0 and first["ok"] > 0
+    failed = {r["id"] for r in read_results(output) if r["status"] == adr_batch.STATUS_ERROR}
+    assert all(r["attempts"] == 2 for r in read_results(output) if r["status"] == adr_batch.STATUS_ERROR)
+
+    # An interrupted run leaves half a line behind; resuming drops it
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "39", "sta')
+
+    healthy = MockCompletionServer(latency=0.0, failure_rate=0.0)
+    second = run_against_mock(encounters, output, healthy, max_retries=1)
+
+    assert second["skipped"] == first["ok"]
+    assert second["ok"] == len(failed) and second["error"] == 0
+    assert healthy.stats["requests"] == len(failed)
+
+    latest = {}
+    for r in read_results(output):
+        latest[r["id"]] = r["status"]
+    assert latest == {str(i): adr_batch.STATUS_OK for i in range(40)}
+
+
+def test_id_zero_is_kept(tmp_path):
+    path = tmp_path / "encounters.jsonl"
+    path.write_text('{"id": 0}\n{"id": ""}\n{"other": 1}\n', encoding="utf-8")
+    assert [i for i, _ in adr_batch.iter_encounters(str(path))] == ["0", "row-1", "row-2"]
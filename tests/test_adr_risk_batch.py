@@ -0,0 +1,93 @@
+"""``score_adr_risk_batch`` must agree with ``compute_adr_risk_level`` row by row."""
+import math
+
+import numpy as np
+import pandas as pd
+from hypothesis import given, settings, strategies as st
+
+from adr_utils import compute_adr_risk_level, score_adr_risk_batch
+
+COLUMNS = ["age", "num_meds", "patient_condition", "bp", "spo2"]
+
+# age and num_meds are compared outside a try in the scalar rule, so only
+# values it can compare (or None) are generated for them
+numbers = st.one_of(
+    st.none(),
+    st.integers(-10, 200),
+    st.floats(allow_nan=True, allow_infinity=True),
+)
+bp_text = st.builds(
+    lambda sys_, dia, sep, pad: f"{pad}{sys_}{sep}{dia}{pad}",
+    st.integers(-50, 300),
+    st.integers(-50, 300),
+    st.sampled_from(["/", " / ", "/ ", "//", "-", "/1/"]),
+    st.sampled_from(["", " ", "\t"]),
+)
+bp_values = st.one_of(
+    st.none(),
+    st.just(float("nan")),
+    st.integers(),
+    st.floats(allow_nan=True),
+    bp_text,
+    st.text(alphabet="0123456789/ _+-.x０１９"),
+    st.text(),
+)
+rows = st.fixed_dictionaries({
+    "age": numbers,
+    "num_meds": numbers,
+    "patient_condition": st.sampled_from([None, "", "Stable", "Guarded", "Critical", "critical"]),
+    "bp": bp_values,
+    "spo2": st.one_of(numbers, st.text(max_size=3)),
+})
+
+
+def _scalar(frame: pd.DataFrame):
+    levels, scores = [], []
+    for r in frame.itertuples(index=False):
+        level, score = compute_adr_risk_level(r.age, r.num_meds, r.patient_condition, r.bp, r.spo2)
+        levels.append(level)
+        scores.append(score)
+    return levels, scores
+
+
+def _assert_matches(frame: pd.DataFrame):
+    result = score_adr_risk_batch(frame)
+    levels, scores = _scalar(frame)
+    assert result["adr_risk_score"].tolist() == scores
+    assert result["adr_risk_level"].astype(str).tolist() == levels
+    assert result.index.equals(frame.index)
+
+
+@settings(max_examples=300, deadline=None)
+@given(st.lists(rows, max_size=30))
+def test_batch_matches_scalar_on_mixed_values(records):
+    frame = pd.DataFrame(records, columns=COLUMNS, dtype=object)
+    _assert_matches(frame)
+
+
+@settings(max_examples=100, deadline=None)
+@given(st.lists(rows, max_size=30))
+def test_batch_matches_scalar_with_inferred_dtypes(records):
+    # Columns as pandas infers them, e.g. float columns with NaN for None
+    frame = pd.DataFrame(records, columns=COLUMNS)
+    _assert_matches(frame)
+
+
+def test_empty_frame():
+    frame = pd.DataFrame({c: pd.Series(dtype=object) for c in COLUMNS})
+    result = score_adr_risk_batch(frame)
+    assert result.empty
+    assert list(result.columns) == ["adr_risk_level", "adr_risk_score"]
+
+
+@given(st.integers(0, 20))
+def test_all_nan_bp_column(n):
+    # What read_csv gives for an empty BP column
+    frame = pd.DataFrame({
+        "age": np.full(n, 70.0),
+        "num_meds": np.full(n, math.nan),
+        "patient_condition": ["Critical"] * n,
+        "bp": np.full(n, math.nan),
+        "spo2": np.full(n, 90.0),
+    })
+    _assert_matches(frame)
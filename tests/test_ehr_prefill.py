@@ -0,0 +1,78 @@
+"""Prefill of the EHR form from a patient's latest saved encounter."""
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+import encounter_store
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ehr_app.py")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("EHR_WARMUP", "0")
+    store = encounter_store.EncounterStore(str(tmp_path / "encounters.db"))
+    store.save_many([{
+        "patient_id": "P1",
+        "mrn": "M1",
+        "encounter_date": "2026-01-05",
+        "full_name": "Stored Patient",
+        "allergies": "penicillin",
+    }])
+    monkeypatch.setattr(encounter_store, "get_encounter_store", lambda *args: store)
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    return at
+
+
+def _sidebar_input(at, label):
+    return next(w for w in at.sidebar.text_input if w.label == label)
+
+
+def _type(at, key, value):
+    widget = next(w for w in list(at.text_input) + list(at.text_area) if w.key == key)
+    widget.set_value(value).run()
+
+
+def test_adding_mrn_keeps_typed_fields(app):
+    _sidebar_input(app, "Patient ID").set_value("P9").run()
+    _type(app, "full_name", "Jane Roe")
+    _type(app, "allergies", "latex")
+
+    _sidebar_input(app, "MRN").set_value("M9").run()
+
+    assert app.session_state["full_name"] == "Jane Roe"
+    assert app.session_state["allergies"] == "latex"
+
+
+def test_fixing_id_typo_keeps_typed_fields(app):
+    _sidebar_input(app, "Patient ID").set_value("P99").run()
+    _type(app, "full_name", "Jane Roe")
+
+    _sidebar_input(app, "Patient ID").set_value("P9").run()
+
+    assert app.session_state["full_name"] == "Jane Roe"
+
+
+def test_switching_patients_never_leaks_stored_data(app):
+    _sidebar_input(app, "Patient ID").set_value("P1").run()
+    assert app.session_state["full_name"] == "Stored Patient"
+    assert app.session_state["allergies"] == "penicillin"
+
+    _sidebar_input(app, "Patient ID").set_value("P2").run()
+    assert app.session_state["full_name"] == ""
+    assert app.session_state["allergies"] == ""
+
+
+def test_loading_a_stored_patient_replaces_typed_fields(app):
+    _sidebar_input(app, "Patient ID").set_value("P9").run()
+    _type(app, "full_name", "Jane Roe")
+    _type(app, "allergies", "latex")
+
+    _sidebar_input(app, "Patient ID").set_value("P1").run()
+
+    assert app.session_state["full_name"] == "Stored Patient"
+    assert app.session_state["allergies"] == "penicillin"
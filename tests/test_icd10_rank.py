@@ -0,0 +1,48 @@
+"""Ranked search puts the usual codes for common one-word queries on top."""
+import os
+
+import pytest
+
+import icd10_utils as u
+
+pytestmark = pytest.mark.skipif(not os.path.exists(u.ICD_PATH), reason="CMS ICD-10 file not present")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return u.get_icd10_index()
+
+
+def _top(index, query, k=5):
+    rows, _ = index.rank(query, k)
+    return [str(index.df.iloc[r, 0]) for r in rows]
+
+
+def test_diabetes_ranks_diabetes_mellitus_first(index):
+    top = _top(index, "diabetes")
+    assert "E232" not in top  # Diabetes insipidus
+    assert all(code[0] in "EO" for code in top)
+    assert _top(index, "diabetes insipidus", 2) == ["N251", "E232"]
+
+
+def test_hypertension_ranks_essential_hypertension_high(index):
+    assert "I10" in _top(index, "hypertension", 4)
+    assert _top(index, "ocular hypertension", 1)[0].startswith("H4005")
+
+
+def test_pneumonia_ranks_pneumonia_categories_first(index):
+    top = _top(index, "pneumonia", 10)
+    assert "A0103" not in top  # Typhoid pneumonia
+    # Pneumonia categories (J12-J18, congenital P23), not infections that
+    # list pneumonia as one complication
+    assert all(code[:2] in ("J1", "P2") for code in top)
+
+
+@pytest.mark.parametrize("query, code", [
+    ("chest pain", "R079"),
+    ("heart failure", "I509"),
+    ("atrial fibrillation", "I4891"),
+    ("type 2 diabetes", "E119"),
+])
+def test_common_terms_find_their_usual_code(index, query, code):
+    assert code in _top(index, query, 10)
@@ -0,0 +1,133 @@
+"""Release registry, row pool and diffs on small synthetic CMS releases."""
+import json
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import icd10_utils
+import icd10_releases
+from icd10_releases import ICD10ReleaseRegistry, discover_releases
+
+CODE, SHORT, LONG, NF = "CODE", "SHORT DESCRIPTION", "LONG DESCRIPTION", "NF EXCL"
+
+JUL_2025 = [
+    ("A000", "Cholera classical", "Cholera due to Vibrio cholerae 01, biovar cholerae", None),
+    ("E119", "Type 2 DM w/o comp", "Type 2 diabetes mellitus without complications", "Y"),
+    ("I10", "Essential hypertension", "Essential (primary) hypertension", "Y"),
+    ("J449", "COPD, unsp", "Chronic obstructive pulmonary disease, unspecified", None),
+    ("Z9981", "Dependence on supplemental oxygen", "Dependence on supplemental oxygen", None),
+]
+# October: J449 redescribed, I10 moves out of NF exclusion, A000 moves in,
+# Z9981 removed, U071 added
+OCT_2025 = [
+    ("A000", "Cholera classical", "Cholera due to Vibrio cholerae 01, biovar cholerae", "Y"),
+    ("E119", "Type 2 DM w/o comp", "Type 2 diabetes mellitus without complications", "Y"),
+    ("I10", "Essential hypertension", "Essential (primary) hypertension", None),
+    ("J449", "COPD, unsp", "Chronic obstructive pulmonary disease, unspecified type", None),
+    ("U071", "COVID-19", "COVID-19", None),
+]
+JAN_2026 = OCT_2025 + [("R0789", "Other chest pain", "Other chest pain", None)]
+
+
+def _write_release(tmp_path, name, rows):
+    """A stand-in workbook plus the Parquet cache read_icd10 picks up for it."""
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    frame = pd.DataFrame(rows, columns=[CODE, SHORT, LONG, NF])
+    frame.to_parquet(icd10_utils.cache_path_for(str(path)), index=False)
+    return str(path)
+
+
+@pytest.fixture
+def releases(tmp_path, monkeypatch):
+    monkeypatch.setattr(icd10_utils, "CACHE_DIR", str(tmp_path / ".cache"))
+    (tmp_path / ".cache").mkdir()
+    _write_release(tmp_path, "section111-jul2025-custom.xlsx", JUL_2025)
+    _write_release(tmp_path, "section111validicd10-oct2025.xlsx", OCT_2025)
+    current = _write_release(tmp_path, "section111validicd10-jan2026.xlsx", JAN_2026)
+    manifest = tmp_path / "icd10_releases.json"
+    manifest.write_text(json.dumps(
+        [{"name": "2025-07", "path": "section111-jul2025-custom.xlsx", "effective": "2025-07-01"}]
+    ))
+
+    current_frame = icd10_utils.read_icd10(current)
+    monkeypatch.setattr(icd10_releases, "ICD_PATH", current)
+    monkeypatch.setattr(icd10_releases, "load_icd10", lambda: current_frame)
+    registry = ICD10ReleaseRegistry(discover_releases(str(tmp_path), str(manifest)))
+    return registry, current_frame
+
+
+def test_discovery_from_file_names_and_manifest(releases):
+    registry, _ = releases
+    assert registry.names() == ["2025-07", "2025-10", "2026-01"]
+    assert registry.current == "2026-01"
+    assert registry.releases["2025-10"].effective == date(2025, 10, 1)
+
+
+def test_effective_date_selection(releases):
+    registry, _ = releases
+    assert registry.resolve() == "2026-01"
+    assert registry.resolve(as_of="2025-09-30") == "2025-07"
+    assert registry.resolve(as_of=date(2025, 10, 1)) == "2025-10"
+    assert registry.resolve(as_of="2027-05-01") == "2026-01"
+    # Before the earliest release: the earliest
+    assert registry.resolve(as_of="2020-01-01") == "2025-07"
+    with pytest.raises(ValueError):
+        registry.resolve("1999-01")
+
+    names = registry.releases_for_dates(["2025-08-15", "2025-12-31", "2026-01-01", "not a date", None])
+    assert list(names) == ["2025-07", "2025-10", "2026-01", "2026-01", "2026-01"]
+
+
+def test_rows_are_shared_between_releases(releases):
+    registry, current = releases
+    jan, oct_, jul = registry.rows("2026-01"), registry.rows("2025-10"), registry.rows("2025-07")
+    pool = registry.pool
+
+    # January is October plus one code, so it adds nothing for October
+    np.testing.assert_array_equal(oct_, jan[:len(OCT_2025)])
+    # July differs from October in four rows (A000, I10, J449, Z9981)
+    assert len(pool) == len(JAN_2026) + 4
+    assert jul[1] == jan[1]  # E119 is identical in all three
+
+    # The current release is the pool's first segment and frame() is load_icd10()
+    assert len(pool.segments[0]) == len(current)
+    assert registry.frame("2026-01") is current
+    july = registry.frame("2025-07")
+    assert list(july[CODE]) == [r[0] for r in JUL_2025]
+    assert list(july[LONG]) == [r[2] for r in JUL_2025]
+
+
+def test_diff_categories(releases):
+    registry, _ = releases
+    changes = registry.diff("2025-07", "2025-10")
+    by_kind = {kind: sorted(group["CODE"]) for kind, group in changes.groupby("CHANGE")}
+    assert by_kind == {
+        icd10_releases.CHANGE_ADDED: ["U071"],
+        icd10_releases.CHANGE_REMOVED: ["Z9981"],
+        icd10_releases.CHANGE_REDESCRIBED: ["J449"],
+        icd10_releases.CHANGE_NF_EXCLUDED: ["A000"],
+        icd10_releases.CHANGE_NF_INCLUDED: ["I10"],
+    }
+    redescribed = changes[changes["CHANGE"] == icd10_releases.CHANGE_REDESCRIBED].iloc[0]
+    assert redescribed["OLD"].endswith("unspecified")
+    assert redescribed["NEW"].endswith("unspecified type")
+
+    assert registry.diff("2025-10", "2025-10").empty
+    assert list(registry.diff("2025-10", "2026-01")["CODE"]) == ["R0789"]
+
+
+def test_validation_uses_the_release_in_force(releases, monkeypatch):
+    registry, current = releases
+    monkeypatch.setattr(icd10_releases, "get_release_registry", lambda: registry)
+    monkeypatch.setattr(icd10_utils, "get_icd10_index", lambda: icd10_utils.ICD10Index(current))
+    icd10_utils.get_release_index.cache_clear()
+    try:
+        july = icd10_utils.validate_icd10_codes(["Z99.81", "U07.1", "I10"], as_of="2025-08-01")
+        january = icd10_utils.validate_icd10_codes(["Z99.81", "U07.1", "I10"], as_of="2026-02-01")
+    finally:
+        icd10_utils.get_release_index.cache_clear()
+    assert list(july["STATUS"]) == ["valid", "invalid", "nf_excluded"]
+    assert list(january["STATUS"]) == ["invalid", "valid", "valid"]
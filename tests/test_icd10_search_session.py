@@ -0,0 +1,53 @@
+"""Search-as-you-type sessions answer exactly like a fresh search."""
+import os
+
+import numpy as np
+import pytest
+from hypothesis import given, settings, strategies as st
+
+import icd10_utils as u
+
+pytestmark = pytest.mark.skipif(not os.path.exists(u.ICD_PATH), reason="CMS ICD-10 file not present")
+
+SCOPES = ["All", "Included", "Excluded"]
+BACKSPACE = None
+
+# Letters from common clinical words and code characters, so typed queries
+# keep matching for a while before they run out
+keystrokes = st.one_of(
+    st.sampled_from(list("diabetesmllitusfracturmon e1179s72.")),
+    st.just(BACKSPACE),
+)
+steps = st.lists(st.tuples(keystrokes, st.sampled_from(SCOPES), st.booleans()), min_size=1, max_size=40)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return u.get_icd10_index()
+
+
+@settings(max_examples=150, deadline=None)
+@given(steps=steps, max_entries=st.integers(min_value=1, max_value=6))
+def test_session_matches_fresh_search(index, steps, max_entries):
+    # Small LRUs make evictions happen mid-sequence
+    session = u.ICD10SearchSession(max_entries=max_entries, index=index)
+    query = ""
+    for key, scope, ranked in steps:
+        query = query[:-1] if key is BACKSPACE else query + key
+        expected = u._match_rows(index, query, scope, ranked, 50, None)[0]
+        np.testing.assert_array_equal(session.rows(query, scope, ranked, 50), expected)
+        assert len(session._recent) <= max_entries
+
+
+def test_punctuation_only_query_is_not_refined(index):
+    session = u.ICD10SearchSession(index=index)
+    assert len(session.rows(".")) == 0
+    np.testing.assert_array_equal(session.rows(".d"), u._match_rows(index, ".d", "All", False, 50, None)[0])
+
+
+def test_refinement_is_used(index):
+    session = u.ICD10SearchSession(index=index)
+    session.rows("diab")
+    key = ("diabe", "All", False, None)
+    assert session._candidates(key) is not None
+    np.testing.assert_array_equal(session.rows("diabe"), u._match_rows(index, "diabe", "All", False, 50, None)[0])
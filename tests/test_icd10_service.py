@@ -0,0 +1,86 @@
+"""ICD-10 lookup service and its pooled client, over a tiny code set."""
+import asyncio
+import threading
+
+import pandas as pd
+import pytest
+
+import icd10_utils
+from icd10_service import ICD10Service, ICD10ServiceClient
+
+ROWS = [
+    ("E119", "Type 2 DM w/o comp", "Type 2 diabetes mellitus without complications", "Y"),
+    ("E1165", "Type 2 DM w hyperglycemia", "Type 2 diabetes mellitus with hyperglycemia", None),
+    ("I10", "Essential hypertension", "Essential (primary) hypertension", "Y"),
+    ("J449", "COPD, unsp", "Chronic obstructive pulmonary disease, unspecified", None),
+]
+
+
+@pytest.fixture
+def service():
+    df = pd.DataFrame(ROWS, columns=["CODE", "SHORT DESCRIPTION", "LONG DESCRIPTION", "NF EXCL"])
+    svc = ICD10Service(icd10_utils.ICD10Index(df))
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        await svc.handle(reader, writer)
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    port = server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", connections, loop
+
+    async def shutdown():
+        server.close()
+        for writer in connections:
+            writer.close()
+        await server.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def _in_new_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_connections_are_reused_across_threads(service):
+    url, connections, _ = service
+    client = ICD10ServiceClient(url)
+    # Like Streamlit reruns: every request from a new thread
+    for _ in range(5):
+        frame = _in_new_thread(lambda: client.search("diab"))
+        assert list(frame["CODE"]) == ["E119", "E1165"]
+    assert len(connections) == 1
+    client.close()
+
+
+def test_stale_pooled_connection_is_replaced(service):
+    url, connections, loop = service
+    client = ICD10ServiceClient(url)
+    client.health()
+    # The server drops the idle keep-alive connection
+    done = threading.Event()
+    loop.call_soon_threadsafe(lambda: (connections[0].transport.abort(), done.set()))
+    done.wait(5)
+    assert client.validate(["E11.9", "X"])["STATUS"].tolist() == ["nf_excluded", "invalid"]
+    assert len(connections) == 2
+    client.close()
+
+
+def test_search_limit_defaults_to_one_page(service):
+    url, _, _ = service
+    client = ICD10ServiceClient(url)
+    payload = client._get("/search", {"q": ""})
+    assert payload["total"] == len(ROWS)
+    assert len(client.search("")) == len(ROWS)
+    client.close()
@@ -0,0 +1,38 @@
+"""Shared-table mode: the memory-mapped index answers like a built one."""
+import os
+
+import numpy as np
+import pytest
+
+import icd10_utils as u
+
+pytestmark = pytest.mark.skipif(not os.path.exists(u.ICD_PATH), reason="CMS ICD-10 file not present")
+
+QUERIES = ["diab", "fracture femur", "E11", "S72.0", "diabetis", "heart fail"]
+
+
+def test_mapped_index_matches_built_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(u, "SHARED_DIR", str(tmp_path))
+    index_dir = u.build_icd10_shared_index(u.ICD_PATH)
+    df = u.map_icd10_shared_table(u.build_icd10_shared_table(u.ICD_PATH))
+
+    arrays = u.map_icd10_shared_index(index_dir)
+    assert all(isinstance(a, np.memmap) for a in arrays.values())
+    shared, built = u.ICD10Index(df, arrays), u.ICD10Index(df)
+
+    for query in QUERIES:
+        for scope in ("All", "Included", "Excluded"):
+            for ranked in (False, True):
+                np.testing.assert_array_equal(
+                    u._match_rows(shared, query, scope, ranked, 20, None)[0],
+                    u._match_rows(built, query, scope, ranked, 20, None)[0],
+                )
+    np.testing.assert_array_equal(shared.code_prefix("E11"), built.code_prefix("E11"))
+    assert shared.code_children("E11").equals(built.code_children("E11"))
+
+
+def test_mismatched_index_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(u, "SHARED_DIR", str(tmp_path))
+    arrays = u.map_icd10_shared_index(u.build_icd10_shared_index(u.ICD_PATH))
+    with pytest.raises(ValueError):
+        u.ICD10Index(u.load_icd10().iloc[:10], arrays)
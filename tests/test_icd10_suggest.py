@@ -0,0 +1,53 @@
+"""ICD-10 suggestions for common note wording."""
+import os
+
+import pytest
+
+from icd10_utils import ICD_PATH
+
+pytestmark = pytest.mark.skipif(not os.path.exists(ICD_PATH), reason="CMS ICD-10 file not present")
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    from icd10_suggest import get_phrase_matcher
+    return get_phrase_matcher()
+
+
+def _codes(matcher, note, k=5):
+    return [s["CODE"] for s in matcher.suggest(note, k)]
+
+
+def test_core_phrase_drops_generic_qualifiers():
+    from icd10_suggest import core_phrase
+
+    assert core_phrase("Essential (primary) hypertension") == "essential hypertension"
+    assert core_phrase("Unspecified asthma with (acute) exacerbation") == "asthma"
+    assert core_phrase("Other acute appendicitis") == "acute appendicitis"
+    assert core_phrase("Chronic obstructive pulmonary disease, unspecified") == "chronic obstructive pulmonary disease"
+
+
+@pytest.mark.parametrize("note, code", [
+    ("72 yo M with long-standing hypertension, well controlled on lisinopril.", "I10"),
+    ("History of essential hypertension and hyperlipidemia.", "I10"),
+    ("Known asthma, uses albuterol inhaler as needed.", "J45909"),
+    ("Patient with COPD on home oxygen, presents with worsening dyspnea.", "J449"),
+    ("New onset atrial fibrillation with rapid ventricular response.", "I4891"),
+    ("CT abdomen consistent with acute appendicitis; surgery consulted.", "K3580"),
+    ("PMH: HTN, afib on apixaban.", "I4891"),
+])
+def test_common_note_terms_are_suggested(matcher, note, code):
+    assert code in _codes(matcher, note)
+
+
+def test_best_code_for_bare_terms(matcher):
+    assert _codes(matcher, "hypertension")[0] == "I10"
+    assert _codes(matcher, "asthma")[0] == "J45909"
+    assert _codes(matcher, "acute appendicitis")[0] == "K3580"
+
+
+def test_negated_term_is_flagged(matcher):
+    suggestions = matcher.suggest("Denies asthma. Treated for hypertension.", 10)
+    flags = {s["CODE"]: s["NEGATED"] for s in suggestions}
+    assert flags["I10"] is False
+    assert flags["J45909"] is True
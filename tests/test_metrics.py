@@ -0,0 +1,51 @@
+"""Metrics exporter binding and the admin sidebar panel."""
+import socket
+import urllib.request
+
+import pytest
+
+import metrics
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    metrics.start_exporter.cache_clear()
+    yield
+    metrics.start_exporter.cache_clear()
+
+
+def test_exporter_binds_loopback_by_default(enabled):
+    server = metrics.start_exporter(_free_port())
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _panel_app():
+    import metrics
+    metrics.metrics_sidebar()
+
+
+@pytest.mark.parametrize("admin, shown", [(False, False), (True, True)])
+def test_admin_panel_needs_the_env_flag(enabled, monkeypatch, admin, shown):
+    pytest.importorskip("streamlit")
+    from streamlit.testing.v1 import AppTest
+
+    monkeypatch.setattr(metrics, "ADMIN", admin)
+    at = AppTest.from_function(_panel_app, default_timeout=30)
+    # The URL parameter alone no longer opens the panel
+    at.query_params["admin"] = "1"
+    at.run()
+    assert any(b.label == "Reset metrics" for b in at.sidebar.button) is shown